@@ -0,0 +1,86 @@
+import argparse
+import csv
+import json
+import multiprocessing
+import sys
+from classes import Game
+from solver import solveGame
+
+FIELDS = ["deal", "draw", "winnable", "solution_length", "nodes", "seconds", "nodes_per_second"]
+
+# ? Batch deal analysis. Deals are numbered by their seed, so deal N here is the same deal as Game(turn, N).
+# Usage: python analyze.py 0 100000 --draw 3 --output deals.csv
+# With --deals, only the listed deals in the range are solved, e.g. the easiest ones picked by difficulty.py.
+
+def analyzeDeal(job):
+    deal, turnthree, maxNodes = job
+    result = solveGame(Game(turnthree, deal), maxNodes)
+    return {
+        "deal": deal,
+        "draw": 3 if turnthree else 1,
+        "winnable": {True: "yes", False: "no", None: "unknown"}[result.solvable],
+        "solution_length": len(result.moves) if result.solvable else None,
+        "nodes": result.nodes,
+        "seconds": round(result.elapsed, 4),
+        "nodes_per_second": round(result.nodesPerSecond),
+    }
+
+class ResultWriter:
+    def __init__(self, path: str):
+        self.file = sys.stdout if path == "-" else open(path, "a", newline="", encoding="utf-8")
+        self.jsonl = path.endswith(".jsonl")
+        if not self.jsonl:
+            self.writer = csv.DictWriter(self.file, FIELDS)
+            if self.file is sys.stdout or self.file.tell() == 0:
+                self.writer.writeheader()
+
+    def write(self, row):
+        if self.jsonl:
+            self.file.write(json.dumps(row) + "\n")
+        else:
+            self.writer.writerow(row)
+
+    def close(self):
+        self.file.flush()
+        if self.file is not sys.stdout:
+            self.file.close()
+
+def parseArgs(argv):
+    parser = argparse.ArgumentParser(description="Solve a range of seeded deals in parallel and stream the results to CSV or JSONL.")
+    parser.add_argument("start", type=int, help="First deal number.")
+    parser.add_argument("end", type=int, help="Last deal number (exclusive).")
+    parser.add_argument("--draw", type=int, choices=[1, 3], default=1, help="Draw 1 or draw 3.")
+    parser.add_argument("--output", default="-", help="Output file, .jsonl for JSON lines, anything else for CSV. Appends. Default stdout.")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes. Default is one per core.")
+    parser.add_argument("--max-nodes", type=int, default=500000, help="Search effort per deal before giving up as unknown.")
+    parser.add_argument("--chunk", type=int, default=16, help="Deals handed to a worker at a time.")
+    parser.add_argument("--deals", default=None, help="File of deal numbers, one per line; only those within the range are analyzed.")
+    return parser.parse_args(argv)
+
+def listedDeals(path: str, start: int, end: int):
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            if line.strip() and start <= int(line) < end:
+                yield int(line)
+
+def main(argv=None):
+    args = parseArgs(argv)
+    deals = listedDeals(args.deals, args.start, args.end) if args.deals else range(args.start, args.end)
+    jobs = ((deal, args.draw == 3, args.max_nodes) for deal in deals)
+    writer = ResultWriter(args.output)
+    done = 0
+    try:
+        with multiprocessing.Pool(args.workers) as pool:
+            # Unordered so one slow deal doesn't hold back the rest; rows carry their deal number.
+            for row in pool.imap_unordered(analyzeDeal, jobs, args.chunk):
+                writer.write(row)
+                done += 1
+                if done % 1000 == 0:
+                    writer.file.flush()
+                    print(f"{done} deals analyzed.", file=sys.stderr)
+    finally:
+        writer.close()
+
+# Init.
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from classes import Deck, Game, setGlyphCacheEnabled
+from solver import solveGame
+
+# ? Benchmarks for the rendering, rule and simulation hot paths. Runs without a terminal and writes JSON that can be compared across commits:
+#   python benchmark.py --output before.json
+#   python benchmark.py --baseline before.json
+# Fails (exit code 1) if anything is slower than its limit: the baseline times the tolerance, or the built-in THRESHOLDS without a baseline.
+
+DEAL = 2 # A quick-to-solve draw 1 deal, used to get early, mid and late game positions.
+
+# Microseconds per operation. Generous, meant to catch big regressions on slow machines, not noise.
+THRESHOLDS = {
+    "drawGame.early": 500,
+    "drawGame.mid": 500,
+    "drawGame.late": 800,
+    "drawGame.late.uncachedGlyphs": 1500,
+    "drawGame.cachedFrame": 20,
+    "Card.drawCard": 5,
+    "Deck.drawCycle": 300,
+    "placeGrabbedCard.rejected": 50,
+    "autoMoveToFoundation": 50,
+    "legalMoves": 100,
+    "randomPlay.game": 100000,
+}
+
+def seededStates():
+    # Early, mid and late positions of the same deal, reached by following its solution.
+    moves = solveGame(Game(False, DEAL), 100000).moves
+    output = {}
+    for name, fraction in (("early", 0), ("mid", 1 / 3), ("late", 2 / 3)):
+        game = Game(False, DEAL)
+        game.revealTops()
+        for move in moves[:int(len(moves) * fraction)]:
+            game.applyMove(move, False)
+        output[name] = game
+    return output
+
+def measure(function, minTime: float = 0.2, repeats: int = 5):
+    # Best of a few runs, each long enough to swamp timer resolution. Returns microseconds per call.
+    count = 1
+    while True:
+        start = time.perf_counter()
+        for i in range(count):
+            function()
+        elapsed = time.perf_counter() - start
+        if elapsed >= minTime / repeats:
+            break
+        count *= 2
+    best = elapsed / count
+    for repeat in range(repeats - 1):
+        start = time.perf_counter()
+        for i in range(count):
+            function()
+        best = min(best, (time.perf_counter() - start) / count)
+    return best * 1e6
+
+def benchCachedFrame(game):
+    # Moving the cursor between two columns and back, both views already drawn.
+    def run():
+        game.cursorpos = 1
+        game.drawGame()
+        game.cursorpos = 2
+        game.drawGame()
+    return run
+
+def benchDrawCard():
+    # 52 cards, 3 variants each.
+    cards = Deck(DEAL).cards
+    def run():
+        for card in cards:
+            card.drawCard(True)
+            card.drawCard(below=True)
+            card.drawCard(grabbed=True)
+    return run
+
+def benchDeckCycle():
+    deck = Deck(DEAL)
+    def run():
+        while deck.stockCount > 0:
+            deck.draw(3)
+        deck.clearWaste()
+    return run
+
+def benchRejectedPlace(game):
+    # Grab the top of column 1, try every other column (most refuse it), then put it back.
+    def run():
+        game.cursorpos = 1
+        game.grabSelectedCard()
+        for column in range(2, 8):
+            game.cursorpos = column
+            game.placeGrabbedCard()
+            if len(game.grabbedCards) == 0:
+                game.undo()
+                game.cursorpos = 1
+                game.grabSelectedCard()
+        game.putBackCard()
+    return run
+
+def benchAutoMove(game):
+    def run():
+        for column in range(1, 8):
+            game.cursorpos = column
+            game.autoMoveToFoundation()
+            if game.history.undoCount > 0:
+                game.undo()
+    return run
+
+def benchRandomPlay():
+    seeds = iter(range(10 ** 9))
+    def run():
+        # Random legal moves until stuck, won or 300 moves in.
+        seed = next(seeds)
+        rng = random.Random(seed)
+        game = Game(seed % 2 == 0, seed)
+        game.revealTops()
+        for i in range(300):
+            moves = game.legalMoves()
+            if len(moves) == 0 or game.winState:
+                break
+            game.applyMove(rng.choice(moves), False)
+    return run
+
+def runBenchmarks(minTime: float):
+    results = {}
+    def record(name, function, perCall = 1):
+        results[name] = round(measure(function, minTime) / perCall, 3)
+        print(f"{name:32} {results[name]:10.3f} us", file=sys.stderr)
+
+    states = seededStates()
+    # renderFrame is drawGame without the frame cache, which would otherwise answer every call after the first.
+    for name, game in states.items():
+        record(f"drawGame.{name}", game.renderFrame)
+    setGlyphCacheEnabled(False)
+    record("drawGame.late.uncachedGlyphs", states["late"].renderFrame)
+    setGlyphCacheEnabled(True)
+    record("drawGame.cachedFrame", benchCachedFrame(states["mid"]), 2)
+    record("Card.drawCard", benchDrawCard(), 52 * 3)
+    record("Deck.drawCycle", benchDeckCycle())
+    record("placeGrabbedCard.rejected", benchRejectedPlace(seededStates()["mid"]), 6)
+    record("autoMoveToFoundation", benchAutoMove(seededStates()["mid"]), 7)
+    record("legalMoves", states["mid"].legalMoves)
+    record("randomPlay.game", benchRandomPlay())
+    return results
+
+def gitCommit():
+    # The commit of the checkout this file is in, wherever it's run from.
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def checkRegressions(results, baseline, tolerance: float):
+    failures = []
+    for name, value in results.items():
+        if baseline is not None:
+            if name in baseline and value > baseline[name] * tolerance:
+                failures.append(f"{name}: {value:.3f} us, baseline {baseline[name]:.3f} us (limit x{tolerance})")
+        elif name in THRESHOLDS and value > THRESHOLDS[name]:
+            failures.append(f"{name}: {value:.3f} us, limit {THRESHOLDS[name]} us")
+    return failures
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark rendering, rules and simulation without a terminal.")
+    parser.add_argument("--output", default=None, help="Write the results as JSON here (stdout if not given).")
+    parser.add_argument("--baseline", default=None, help="JSON from an earlier run to compare against.")
+    parser.add_argument("--tolerance", type=float, default=1.25, help="How much slower than the baseline is allowed. Default 1.25.")
+    parser.add_argument("--min-time", type=float, default=0.2, help="Rough seconds spent on each benchmark.")
+    args = parser.parse_args(argv)
+
+    results = runBenchmarks(args.min_time)
+    report = {
+        "commit": gitCommit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "unit": "microseconds per operation",
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as file:
+            baseline = json.load(file)["results"]
+    failures = checkRegressions(results, baseline, args.tolerance)
+    if len(failures) > 0:
+        print("PERFORMANCE REGRESSION:", file=sys.stderr)
+        for failure in failures:
+            print("  " + failure, file=sys.stderr)
+        sys.exit(1)
+
+# Init.
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,11 @@
 from enum import Enum
+from collections import namedtuple, OrderedDict
+from array import array
+from functools import cache
 import random
 import datetime
+import sys
+import time
 
 DECK = """|¯¯¯¯¯| 
 ||¯¯¯¯¯|
@@ -18,6 +23,10 @@ FOUNDATION_EMPTY = """|¯¯¯¯¯|
 | /// |
 |_____|"""
 
+DECK_LINES = DECK.split("\n")
+DECK_EMPTY_LINES = DECK_EMPTY.split("\n")
+FOUNDATION_EMPTY_LINES = FOUNDATION_EMPTY.split("\n")
+
 class Suit(Enum):
     __order__ = "Spades Hearts Clubs Diamonds"
     Spades = 1
@@ -41,6 +50,107 @@ class Value(Enum):
     Queen = 12
     King = 13
 
+MAX_SEED = 2 ** 32
+
+class Pile(Enum):
+    Stock = 1
+    Waste = 2
+    Tableau = 3
+    Foundation = 4
+
+# ? A single headless move. Indexes are 0-based (tableau column, foundation slot). Drawing is Stock -> Waste, resetting the waste is Waste -> Stock.
+Move = namedtuple("Move", ["source", "sourceIndex", "destination", "destinationIndex", "count"])
+
+# ? What applyMove changed besides the move itself, so unapplyMove can put it back exactly. revealed: a tableau card was turned over. wasteVisible: len(Game.waste) before. wasteHidden: previous Card.wasteHidden bits of the waste cards touched.
+MoveDelta = namedtuple("MoveDelta", ["move", "revealed", "wasteVisible", "wasteHidden"])
+
+# Per card index (see Card.index).
+RANK = tuple(card % 13 + 1 for card in range(52))
+SUIT = tuple(card // 13 for card in range(52))
+RED = tuple(card // 13 in (1, 3) for card in range(52))
+
+PILES = list(Pile)
+
+# ? A Move packed into 16 bits: source pile (2), source index (3), destination pile (2), destination index (3), count (6). Recordings store these as they are.
+def encodeMove(move: Move):
+    return (move.source.value - 1) | move.sourceIndex << 2 | (move.destination.value - 1) << 5 | move.destinationIndex << 7 | move.count << 10
+
+def decodeMove(code: int):
+    return Move(PILES[code & 3], code >> 2 & 7, PILES[code >> 5 & 3], code >> 7 & 7, code >> 10 & 63)
+
+# ? A MoveDelta packed into 26 bits: the move's 16 bits, then revealed (1), waste visible (6), waste hidden (3).
+def encodeDelta(delta: MoveDelta):
+    return encodeMove(delta.move) | delta.revealed << 16 | delta.wasteVisible << 17 | delta.wasteHidden << 23
+
+def decodeDelta(value: int):
+    return MoveDelta(decodeMove(value & 0xFFFF), bool(value >> 16 & 1), value >> 17 & 63, value >> 23 & 7)
+
+# ? Undo/redo history of packed MoveDeltas, 4 bytes a move. Undo is a fixed-size ring, so past the capacity the oldest moves are forgotten instead of growing.
+class History:
+    def __init__(self, capacity: int = 4096):
+        self.capacity = capacity
+        self.undoBuffer = array("I", bytes(4 * capacity))
+        self.undoStart = 0
+        self.undoCount = 0
+        self.redoStack = array("I")
+
+    def record(self, delta: MoveDelta, clearRedo: bool = True):
+        self.undoBuffer[(self.undoStart + self.undoCount) % self.capacity] = encodeDelta(delta)
+        if self.undoCount == self.capacity:
+            self.undoStart = (self.undoStart + 1) % self.capacity
+        else:
+            self.undoCount += 1
+        if clearRedo and len(self.redoStack) > 0:
+            del self.redoStack[:]
+
+    def popUndo(self):
+        if self.undoCount == 0:
+            return None
+        self.undoCount -= 1
+        value = self.undoBuffer[(self.undoStart + self.undoCount) % self.capacity]
+        self.redoStack.append(value)
+        return decodeDelta(value)
+
+    def popRedo(self):
+        if len(self.redoStack) == 0:
+            return None
+        return decodeDelta(self.redoStack.pop())
+
+    def clear(self):
+        self.undoStart = 0
+        self.undoCount = 0
+        del self.redoStack[:]
+
+# ? Recently drawn frames of one game, least recently used first. Keyed by Game.frameKey, so moving the cursor back to a view seen since the last card moved is a lookup.
+class FrameCache:
+    def __init__(self, capacity: int = 32):
+        self.capacity = capacity
+        self.frames = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.bytes = 0 # Memory held by the cached frame strings.
+
+    def get(self, key):
+        frame = self.frames.get(key)
+        if frame is None:
+            self.misses += 1
+            return None
+        self.frames.move_to_end(key)
+        self.hits += 1
+        return frame
+
+    def put(self, key, frame: str):
+        if self.capacity <= 0:
+            return
+        self.frames[key] = frame
+        self.bytes += sys.getsizeof(frame)
+        while len(self.frames) > self.capacity:
+            self.bytes -= sys.getsizeof(self.frames.popitem(last=False)[1])
+
+    @property
+    def hitRate(self):
+        return self.hits / (self.hits + self.misses) if self.hits + self.misses > 0 else 0
+
 # https://stackoverflow.com/a/8907269
 def strfdelta(tdelta, fmt):
     d = {"days": tdelta.days}
@@ -88,14 +198,51 @@ def getSymbolFromValue(value: Value):
     else:
         return str(value.value)
 
+# ? Every glyph drawCard can produce, built once on first use. Indexed by card index * 32 + flag bits (isFront, grabbed, below, hidden, wasteHidden from lowest bit up).
+GLYPH_CACHE = None
+GLYPH_LINES_CACHE = None
+GLYPH_CACHE_ENABLED = True
+
+def buildGlyphCache():
+    global GLYPH_CACHE, GLYPH_LINES_CACHE
+    cache = [None] * (52 * 32)
+    for card in createDeck():
+        for flags in range(32):
+            card.hidden = bool(flags & 8)
+            card.wasteHidden = bool(flags & 16)
+            cache[card.index * 32 + flags] = card.renderCard(bool(flags & 1), bool(flags & 2), bool(flags & 4))
+    GLYPH_CACHE = cache
+    GLYPH_LINES_CACHE = [tuple(glyph.split("\n")) for glyph in cache]
+    return cache
+
+def setGlyphCacheEnabled(enabled: bool):
+    # Lets benchmarks compare cached and uncached frames.
+    global GLYPH_CACHE_ENABLED
+    GLYPH_CACHE_ENABLED = enabled
+
 class Card:
     def __init__(self, suit: Suit, value: Value, hidden = True):
         self.suit = suit
         self.value = value
         self.hidden = hidden
         self.wasteHidden = False
+        self.index = (suit.value - 1) * 13 + value.value - 1
 
     def drawCard(self, isFront: bool = False, grabbed: bool = False, below: bool = False):
+        if not GLYPH_CACHE_ENABLED:
+            return self.renderCard(isFront, grabbed, below)
+        cache = GLYPH_CACHE or buildGlyphCache()
+        return cache[self.index * 32 + (isFront | grabbed << 1 | below << 2 | self.hidden << 3 | self.wasteHidden << 4)]
+
+    def drawCardLines(self, isFront: bool = False, grabbed: bool = False, below: bool = False):
+        # Same as drawCard(...).split("\n"), without the split.
+        if not GLYPH_CACHE_ENABLED:
+            return tuple(self.renderCard(isFront, grabbed, below).split("\n"))
+        if GLYPH_LINES_CACHE is None:
+            buildGlyphCache()
+        return GLYPH_LINES_CACHE[self.index * 32 + (isFront | grabbed << 1 | below << 2 | self.hidden << 3 | self.wasteHidden << 4)]
+
+    def renderCard(self, isFront: bool = False, grabbed: bool = False, below: bool = False):
         if self.value == Value.Ten:
             if self.wasteHidden:
                 middleLine = f"|{getSymbolFromValue(self.value)}{getSymbolFromSuit(self.suit)}"
@@ -165,50 +312,226 @@ class Foundation:
         else:
             return self.cards[-1].drawCard(True)
 
+# ? Zobrist-style state hashing. Every piece of a position (a card at a tableau depth, face up or down, a card on a foundation slot, a link in the stock/waste sequence, the cursor...) has a fixed 64-bit key, and the hash is the XOR of the keys present.
+# Moves XOR out the keys they remove and XOR in the ones they add, so the hash is kept up to date per move instead of recomputed. Keys come from splitmix64, so hashes are the same on every run and platform.
+MASK64 = (1 << 64) - 1
+TABLEAU_KEY = 1 << 20
+FOUNDATION_KEY = 2 << 20
+LINK_KEY = 3 << 20
+CURSOR_KEY = 4 << 20
+VISIBLE_KEY = 5 << 20
+DRAW_KEY = 6 << 20
+
+@cache
+def zobristKey(value: int):
+    value = (value + 0x9E3779B97F4A7C15) & MASK64
+    value = ((value ^ (value >> 30)) * 0xBF58476D1CE4E5B9) & MASK64
+    value = ((value ^ (value >> 27)) * 0x94D049BB133111EB) & MASK64
+    return value ^ (value >> 31)
+
+def tableauKey(card: int, column: int, depth: int, hidden: bool):
+    return zobristKey(TABLEAU_KEY | card << 12 | column << 8 | depth << 1 | hidden)
+
+def foundationKey(card: int, slot: int):
+    return zobristKey(FOUNDATION_KEY | card << 4 | slot)
+
+def linkKey(previous: int, next: int):
+    return zobristKey(LINK_KEY | previous << 8 | next)
+
+# ? The stock and waste are one fixed sequence of cards in draw order: the waste (oldest first), then the stock (next to draw first). Resetting the waste never reorders it, so instead of moving cards around the deck keeps a doubly linked list over card indexes and a cursor on the next card to draw.
+# Drawing and resetting only move the cursor, and a card taken off the waste is unlinked, leaving a tombstone in the sequence. A card put back on the waste is linked in just before the cursor. All O(1), nothing is copied.
+# hash covers the links and the cursor, so it follows the order of both piles and where one ends and the other starts.
+# reachable holds the stock cards that will come up on top of the waste by drawing from here to the end of this pass (every drawCount-th card, and the last). Kept up to date as cards are drawn, rebuilt when a pass starts.
+END = 52 # Sentinel linking the end of the sequence back to its start.
+
 class Deck:
-    def __init__(self):
-        self.cards = []
-        self.removed_cards = []
-        self.shuffle()
+    def __init__(self, seed: int = None, drawCount: int = 1, shuffle: bool = True):
+        self.drawCount = drawCount
+        self.seed = seed
+        if shuffle:
+            self.shuffle(seed)
+        else:
+            self.restore([], [])
 
-    def shuffle(self):
+    def shuffle(self, seed: int = None):
+        # ? Every deal is identified by its seed (or deal number), so the same seed always gives the same deal. Without one, a fresh seed is picked.
+        if seed is None:
+            seed = random.randrange(MAX_SEED)
+        self.seed = seed
         output = createDeck()
-        random.shuffle(output)
-        self.cards = output
-        self.removed_cards = []
+        random.Random(seed).shuffle(output)
+        self.restore(output, [])
+
+    def restore(self, cards, removedCards):
+        # Sets the stock and waste from lists in the old Deck.cards/Deck.removed_cards order (stock drawn from the end, waste topped by the end).
+        self.slots = [None] * 52
+        self.next = [END] * (END + 1)
+        self.previous = [END] * (END + 1)
+        last = END
+        for card in list(removedCards) + list(reversed(cards)):
+            self.slots[card.index] = card
+            self.next[last] = card.index
+            self.previous[card.index] = last
+            last = card.index
+        self.next[last] = END
+        self.previous[END] = last
+        self.stockCount = len(cards)
+        self.wasteCount = len(removedCards)
+        self.cursor = END if len(cards) == 0 else cards[-1].index
+        self.hash = zobristKey(CURSOR_KEY | self.cursor)
+        slot = END
+        while True:
+            self.hash ^= linkKey(slot, self.next[slot])
+            slot = self.next[slot]
+            if slot == END:
+                break
+        self.rebuildReachable()
+
+    @property
+    def cards(self):
+        # A copy of the stock, next card to draw last. For inspection only, change the deck through its methods.
+        output = []
+        slot = self.cursor
+        while slot != END:
+            output.append(self.slots[slot])
+            slot = self.next[slot]
+        output.reverse()
+        return output
+
+    @property
+    def removed_cards(self):
+        # A copy of the waste, top card last.
+        return self.wasteTop(self.wasteCount)
+
+    def stockTop(self, count: int):
+        # The next count cards to be drawn, in draw order.
+        output = []
+        slot = self.cursor
+        while slot != END and len(output) < count:
+            output.append(self.slots[slot])
+            slot = self.next[slot]
+        return output
+
+    def wasteTop(self, count: int):
+        # The top count cards of the waste, top card last.
+        output = []
+        slot = self.previous[self.cursor]
+        while slot != END and len(output) < count:
+            output.append(self.slots[slot])
+            slot = self.previous[slot]
+        output.reverse()
+        return output
+
+    def moveCursor(self, slot: int):
+        self.hash ^= zobristKey(CURSOR_KEY | self.cursor) ^ zobristKey(CURSOR_KEY | slot)
+        self.cursor = slot
+
+    def unlink(self, slot: int):
+        previous, next = self.previous[slot], self.next[slot]
+        if slot == self.cursor:
+            self.moveCursor(next)
+        self.next[previous] = next
+        self.previous[next] = previous
+        self.hash ^= linkKey(previous, slot) ^ linkKey(slot, next) ^ linkKey(previous, next)
 
     def draw(self, amount: int = 1, hidden: bool = False, waste: bool = True):
         output = []
+        start = self.cursor
         for i in range(amount):
-            if len(self.cards) != 0:
-                card = self.cards.pop()
+            if self.stockCount != 0:
+                card = self.slots[self.cursor]
                 card.hidden = hidden
                 output.append(card)
+                self.stockCount -= 1
                 if waste:
-                    self.removed_cards.append(card)
+                    self.cursor = self.next[self.cursor]
+                    self.wasteCount += 1
+                    self.reachable.discard(card.index)
+                else:
+                    self.unlink(card.index)
+        if waste:
+            self.hash ^= zobristKey(CURSOR_KEY | start) ^ zobristKey(CURSOR_KEY | self.cursor)
         return output
 
+    def undraw(self, count: int):
+        # Puts the top count waste cards back on the stock, as they were before being drawn. Returns them in draw order.
+        count = min(count, self.wasteCount)
+        if count == 0:
+            return []
+        slot = self.cursor
+        for i in range(count):
+            slot = self.previous[slot]
+        self.moveCursor(slot)
+        self.stockCount += count
+        self.wasteCount -= count
+        cards = self.stockTop(count)
+        # A whole draw doesn't change which of the cards behind it come up; a short one was the end of the stock.
+        if count == self.drawCount or self.stockCount == count:
+            self.reachable.add(cards[-1].index)
+        else:
+            self.rebuildReachable()
+        return cards
+
     def removeCardFromWaste(self, card: Card):
-        self.removed_cards.remove(card)
+        self.unlink(card.index)
+        self.wasteCount -= 1
 
     def addCardBackToWaste(self, card: Card):
-        self.removed_cards.append(card) # ! This feels unsafe; order must be maintained always. Just worried some process might mess it up.
+        # Links the card in on top of the waste, just before the cursor.
+        previous = self.previous[self.cursor]
+        self.slots[card.index] = card
+        self.previous[card.index] = previous
+        self.next[card.index] = self.cursor
+        self.next[previous] = card.index
+        self.previous[self.cursor] = card.index
+        self.hash ^= linkKey(previous, self.cursor) ^ linkKey(previous, card.index) ^ linkKey(card.index, self.cursor)
+        self.wasteCount += 1
 
     def clearWaste(self):
-        self.removed_cards.reverse()
-        for card in self.removed_cards:
-            self.cards.append(card)
-        self.removed_cards = []
+        self.moveCursor(self.next[END])
+        self.stockCount += self.wasteCount
+        self.wasteCount = 0
+        self.rebuildReachable()
+
+    def unclearWaste(self, count: int):
+        # Undoes clearWaste, given how many cards the waste had.
+        count = min(count, self.stockCount)
+        slot = self.cursor
+        for i in range(count):
+            slot = self.next[slot]
+        self.moveCursor(slot)
+        self.stockCount -= count
+        self.wasteCount += count
+        self.rebuildReachable()
+
+    def rebuildReachable(self):
+        self.reachable = set()
+        slot = self.cursor
+        for i in range(self.stockCount):
+            if (i + 1) % self.drawCount == 0 or i == self.stockCount - 1:
+                self.reachable.add(slot)
+            slot = self.next[slot]
 
     def __str__(self):
-        if len(self.cards) == 0:
+        if self.stockCount == 0:
             return DECK_EMPTY
         else:
             return DECK
 
+def positionToPile(position: int):
+    # Cursor position (see Game.cursorpos) to (Pile, index).
+    if position <= 7:
+        return Pile.Tableau, position - 1
+    elif position == 8:
+        return Pile.Waste, 0
+    else:
+        return Pile.Foundation, position - 9
+
 class Game:
-    def __init__(self, turn: bool):
-        self.deck = Deck()
+    def __init__(self, turn: bool, seed: int = None, deal: bool = True):
+        # Without deal the tableau and deck start empty, for states that are filled in afterwards (see PackedState.toGame).
+        self.deck = Deck(seed, 3 if turn else 1, deal)
+        self.seed = self.deck.seed
         self.tableau = []
         self.foundation = []
         self.waste = []
@@ -219,12 +542,25 @@ class Game:
         self.startTime = datetime.datetime.now()
         self.endTime = None
         self.printTime = False
-        self.initTableau()
+        if deal:
+            self.initTableau()
+        else:
+            self.tableau = [[] for i in range(7)]
+            self.hiddenCount = 0
         self.initFoundation()
         self.grabbedCards = []
         self.grabbedCardPos = None
         self.winState = False
         self.newGameState = False
+        self.indexDirty = True # Set whenever cards move outside applyMove/unapplyMove, see rebuildMoveIndex.
+        self.history = History()
+        self.recorder = None # Optional recording.GameRecorder, told about every move, undo and redo.
+        self.statusMessage = None # Replaces the key help on the status line while set (hints).
+        self.profiler = None # Optional framestats.FrameStats, given drawTop/drawTableau timings and the card count.
+        self.grabbedWasteHidden = 0 # Card.wasteHidden of the waste card uncovered by the last grab, for the history.
+        self.positionHash = self.hashPosition() # Tableau and foundation part of stateHash, updated by hashMove and revealTops.
+        self.version = 0 # Bumped by everything that changes the cards (not the cursor), for frameCache.
+        self.frameCache = FrameCache()
 
     def newGame(self):
         if self.newGameState:
@@ -235,6 +571,8 @@ class Game:
     def initTableau(self):
         for i in range(7):
             self.tableau.append(self.deck.draw(i + 1, True, False))
+        self.deck.rebuildReachable()
+        self.hiddenCount = 28 # Face-down cards left in the tableau, kept up to date wherever a card is turned.
 
     def initFoundation(self):
         for i in range(4):
@@ -311,6 +649,16 @@ class Game:
         else:
             return False
 
+    def revealTops(self):
+        # Make the top card of each tableau visible. Not while cards are held, so a grab doesn't turn over the card underneath until it's placed.
+        if len(self.grabbedCards) == 0:
+            for i, column in enumerate(self.tableau):
+                if len(column) > 0 and column[-1].hidden:
+                    column[-1].hidden = False
+                    self.hiddenCount -= 1
+                    self.hashReveal(i)
+                    self.version += 1
+
     def checkWin(self):
         for foundation in self.foundation:
             if len(foundation.cards) != 13:
@@ -319,6 +667,8 @@ class Game:
         self.endTime = datetime.datetime.now()
 
     def grabSelectedCard(self):
+        self.indexDirty = True
+        self.version += 1
         if len(self.grabbedCards) > 0:
             return
         if self.cursorpos <= 7:
@@ -338,6 +688,7 @@ class Game:
                 self.grabbedCardPos = self.cursorpos
                 self.waste.pop()
                 if len(self.waste) > 0:
+                    self.grabbedWasteHidden = int(self.waste[-1].wasteHidden)
                     self.waste[-1].wasteHidden = False
                 self.deck.removeCardFromWaste(self.grabbedCards[0])
         else:
@@ -350,9 +701,23 @@ class Game:
             return
         self.cursorpos = self.grabbedCardPos
         self.placeGrabbedCard()
-        self.moves -= 1
 
     def placeGrabbedCard(self):
+        self.indexDirty = True
+        self.version += 1
+        if len(self.grabbedCards) == 0:
+            return
+        source = self.grabbedCardPos
+        count = len(self.grabbedCards)
+        self.placeGrabbedCardAt()
+        if len(self.grabbedCards) == 0 and source is not None:
+            if source != self.cursorpos:
+                self.recordPlacedMove(source, self.cursorpos, count)
+            else: # Put back where it came from: nothing moved, and nothing for the history.
+                self.moves -= 1
+        self.checkWin()
+
+    def placeGrabbedCardAt(self):
         if len(self.grabbedCards) == 0:
             return
         elif self.cursorpos <= 7:
@@ -381,109 +746,449 @@ class Game:
                 self.grabbedCards = []
                 self.grabbedCardPos = None
                 self.moves += 1
-        self.checkWin()
+
+    def recordPlacedMove(self, source: int, destination: int, count: int):
+        # Turns a finished grab and place into a history entry. Turns over the card left on top of the source column now rather than on the next draw, so the entry knows about it.
+        sourcePile, sourceIndex = positionToPile(source)
+        destinationPile, destinationIndex = positionToPile(destination)
+        move = Move(sourcePile, sourceIndex, destinationPile, destinationIndex, count)
+        revealed = False
+        if sourcePile == Pile.Tableau and len(self.tableau[sourceIndex]) > 0 and self.tableau[sourceIndex][-1].hidden:
+            self.tableau[sourceIndex][-1].hidden = False
+            self.hiddenCount -= 1
+            revealed = True
+        self.hashMove(move, revealed)
+        if sourcePile == Pile.Waste:
+            self.logMove(MoveDelta(move, revealed, len(self.waste) + 1, self.grabbedWasteHidden if len(self.waste) > 0 else 0))
+        else:
+            self.logMove(MoveDelta(move, revealed, len(self.waste), 0))
 
     def autoMoveToFoundation(self):
+        self.indexDirty = True
+        self.version += 1
         if len(self.grabbedCards) == 0:
             self.grabSelectedCard()
         
         if len(self.grabbedCards) == 1:
             for i in range(4):
                 if self.foundation[i].addCard(self.grabbedCards[0]):
+                    source = self.grabbedCardPos
                     self.grabbedCards = []
                     self.grabbedCardPos = None
-                    self.moves += 1
+                    if source is not None and source != i + 9:
+                        self.moves += 1
+                        self.recordPlacedMove(source, i + 9, 1)
                     self.checkWin()
                     return
         self.putBackCard()
 
     def drawNewWaste(self):
-        cards = self.deck.draw((3 if self.turnthree else 1))
-        if len(cards) > 0:
+        # Held cards go back first, so the move (and its history entry) sees every card where it is, like undo and redo.
+        self.putBackCard()
+        if self.deck.stockCount > 0:
+            self.applyMove(Move(Pile.Stock, 0, Pile.Waste, 0, min(3 if self.turnthree else 1, self.deck.stockCount)))
+        else:
+            self.resetWaste()
+
+    def resetWaste(self):
+        self.putBackCard()
+        if self.deck.wasteCount > 0:
+            self.applyMove(Move(Pile.Waste, 0, Pile.Stock, 0, self.deck.wasteCount))
+        else:
+            self.deck.clearWaste()
+            self.waste = []
+            self.version += 1
+
+    # ? Auto-complete: once the stock and waste are empty and nothing in the tableau is face down, the game is won by playing every card to the foundations.
+    def canAutoComplete(self):
+        return self.hiddenCount == 0 and self.deck.stockCount == 0 and self.deck.wasteCount == 0 and len(self.grabbedCards) == 0 and not self.winState
+
+    def autoComplete(self, onCard = None):
+        # Plays the cards lowest first (the lowest card left is always on top of a column). onCard() runs after each one, for animating.
+        if not self.canAutoComplete():
+            return False
+        if self.indexDirty:
+            self.rebuildMoveIndex()
+        remaining = sum(len(column) for column in self.tableau)
+        while remaining > 0:
+            for i in range(7):
+                column = self.tableau[i]
+                if len(column) == 0:
+                    continue
+                slot = self.foundationFor(column[-1])
+                if slot is None:
+                    continue
+                self.foundation[slot].addCard(column.pop())
+                self.indexFoundation(slot)
+                self.indexColumn(i)
+                self.moves += 1
+                self.version += 1
+                remaining -= 1
+                move = Move(Pile.Tableau, i, Pile.Foundation, slot, 1)
+                self.hashMove(move, False)
+                self.logMove(MoveDelta(move, False, 0, 0))
+                if onCard is not None:
+                    onCard()
+        self.checkWin()
+        return True
+
+    def undo(self):
+        if len(self.grabbedCards) > 0:
+            self.putBackCard()
+        delta = self.history.popUndo()
+        if delta is not None:
+            self.unapplyMove(delta)
+            if self.recorder is not None:
+                self.recorder.undo()
+
+    def redo(self):
+        if len(self.grabbedCards) > 0:
+            self.putBackCard()
+        delta = self.history.popRedo()
+        if delta is not None:
+            self.history.record(self.applyMove(delta.move, False), False)
+            if self.recorder is not None:
+                self.recorder.redo()
+
+    def hashPosition(self):
+        # The tableau and foundation part of stateHash, from scratch.
+        output = zobristKey(DRAW_KEY | self.turnthree)
+        for i, column in enumerate(self.tableau):
+            for depth, card in enumerate(column):
+                output ^= tableauKey(card.index, i, depth, card.hidden)
+        for slot, pile in enumerate(self.foundation):
+            for card in pile.cards:
+                output ^= foundationKey(card.index, slot)
+        return output
+
+    def hashReveal(self, i: int):
+        # The top of column i was just turned face up.
+        column = self.tableau[i]
+        self.positionHash ^= tableauKey(column[-1].index, i, len(column) - 1, True) ^ tableauKey(column[-1].index, i, len(column) - 1, False)
+
+    def hashMove(self, move: Move, revealed: bool):
+        # Updates positionHash for a move that has just been made. Stock and waste changes are hashed by the Deck itself.
+        if move.source == Pile.Stock or move.destination == Pile.Stock:
+            return
+        if move.destination == Pile.Tableau:
+            column = self.tableau[move.destinationIndex]
+            cards = column[len(column) - move.count:]
+            for k, card in enumerate(cards):
+                self.positionHash ^= tableauKey(card.index, move.destinationIndex, len(column) - move.count + k, False)
+        else:
+            cards = self.foundation[move.destinationIndex].cards[-1:]
+            self.positionHash ^= foundationKey(cards[0].index, move.destinationIndex)
+        if move.source == Pile.Tableau:
+            column = self.tableau[move.sourceIndex]
+            for k, card in enumerate(cards):
+                self.positionHash ^= tableauKey(card.index, move.sourceIndex, len(column) + k, False)
+            if revealed:
+                self.hashReveal(move.sourceIndex)
+        elif move.source == Pile.Foundation:
+            self.positionHash ^= foundationKey(cards[0].index, move.sourceIndex)
+
+    def stateHash(self):
+        # A stable 64-bit hash of the position: tableau, foundations, stock and waste order, how much of the waste is playable and the draw mode. Only meaningful while no cards are held.
+        return self.positionHash ^ self.deck.hash ^ zobristKey(VISIBLE_KEY | len(self.waste))
+
+    # ? Headless move API. legalMoves lists every move the grab/place rules allow from here, applyMove/unapplyMove perform one without touching the cursor or grab state.
+    # Legality is looked up in two indexes instead of scanning: foundationIndex maps the card index each foundation wants next to its slot, tableauIndex maps the (rank, red) a column top will take to those columns.
+    def rebuildMoveIndex(self):
+        self.foundationIndex = {}
+        self.foundationKeys = [None] * 4
+        self.emptyFoundations = set()
+        for slot in range(4):
+            self.indexFoundation(slot)
+        self.tableauIndex = {}
+        self.tableauKeys = [None] * 7
+        self.emptyColumns = set()
+        for i in range(7):
+            self.indexColumn(i)
+        self.indexDirty = False
+
+    def indexFoundation(self, slot: int):
+        if self.foundationKeys[slot] is not None:
+            del self.foundationIndex[self.foundationKeys[slot]]
+            self.foundationKeys[slot] = None
+        self.emptyFoundations.discard(slot)
+        cards = self.foundation[slot].cards
+        if len(cards) == 0:
+            self.emptyFoundations.add(slot)
+        elif RANK[cards[-1].index] < 13:
+            self.foundationKeys[slot] = cards[-1].index + 1
+            self.foundationIndex[cards[-1].index + 1] = slot
+
+    def indexColumn(self, i: int):
+        if self.tableauKeys[i] is not None:
+            self.tableauIndex[self.tableauKeys[i]].discard(i)
+            self.tableauKeys[i] = None
+        self.emptyColumns.discard(i)
+        column = self.tableau[i]
+        if len(column) == 0:
+            self.emptyColumns.add(i)
+        elif RANK[column[-1].index] > 1:
+            key = (RANK[column[-1].index] - 1, not RED[column[-1].index])
+            self.tableauKeys[i] = key
+            self.tableauIndex.setdefault(key, set()).add(i)
+
+    def foundationFor(self, card: Card):
+        if RANK[card.index] == 1:
+            return min(self.emptyFoundations) if len(self.emptyFoundations) > 0 else None
+        return self.foundationIndex.get(card.index)
+
+    def columnsFor(self, card: Card):
+        if RANK[card.index] == 13:
+            return sorted(self.emptyColumns)
+        return sorted(self.tableauIndex.get((RANK[card.index], RED[card.index]), ()))
+
+    def legalMoves(self):
+        # Nothing can be listed while cards are held; put them back first. Moving an Ace between empty foundations is allowed by the rules but never listed.
+        if len(self.grabbedCards) > 0:
+            return []
+        if self.indexDirty:
+            self.rebuildMoveIndex()
+        output = []
+        if len(self.waste) > 0:
+            slot = self.foundationFor(self.waste[-1])
+            if slot is not None:
+                output.append(Move(Pile.Waste, 0, Pile.Foundation, slot, 1))
+        for i in range(7):
+            column = self.tableau[i]
+            if len(column) > 0:
+                slot = self.foundationFor(column[-1])
+                if slot is not None:
+                    output.append(Move(Pile.Tableau, i, Pile.Foundation, slot, 1))
+        for i in range(7):
+            column = self.tableau[i]
+            if len(column) == 0:
+                continue
+            start = len(column) - 1
+            while start > 0 and not column[start - 1].hidden:
+                start -= 1
+            for k in range(start, len(column)):
+                for j in self.columnsFor(column[k]):
+                    if j != i:
+                        output.append(Move(Pile.Tableau, i, Pile.Tableau, j, len(column) - k))
+        if len(self.waste) > 0:
+            for j in self.columnsFor(self.waste[-1]):
+                output.append(Move(Pile.Waste, 0, Pile.Tableau, j, 1))
+        for slot in range(4):
+            cards = self.foundation[slot].cards
+            if len(cards) > 0:
+                for j in self.columnsFor(cards[-1]):
+                    output.append(Move(Pile.Foundation, slot, Pile.Tableau, j, 1))
+        if self.deck.stockCount > 0:
+            output.append(Move(Pile.Stock, 0, Pile.Waste, 0, min(3 if self.turnthree else 1, self.deck.stockCount)))
+        if self.deck.wasteCount > 0:
+            output.append(Move(Pile.Waste, 0, Pile.Stock, 0, self.deck.wasteCount))
+        return output
+
+    def applyMove(self, move: Move, record: bool = True):
+        # Returns the MoveDelta to hand back to unapplyMove. With record, the move also goes on the undo history.
+        if self.indexDirty:
+            self.rebuildMoveIndex()
+        self.version += 1
+        revealed = False
+        wasteVisible = len(self.waste)
+        wasteHidden = 0
+        if move.source == Pile.Stock:
+            for i, card in enumerate(self.deck.stockTop(move.count)):
+                wasteHidden |= card.wasteHidden << i
+            cards = self.deck.draw(move.count)
             if self.turnthree:
                 for card in cards:
                     card.wasteHidden = True
                 cards[-1].wasteHidden = False
             self.waste = cards
             self.moves += 1
+        elif move.destination == Pile.Stock:
+            self.deck.clearWaste()
+            self.waste = []
         else:
-            self.resetWaste()
+            if move.source == Pile.Tableau:
+                column = self.tableau[move.sourceIndex]
+                cards = column[len(column) - move.count:]
+                del column[len(column) - move.count:]
+                if len(column) > 0 and column[-1].hidden:
+                    column[-1].hidden = False
+                    self.hiddenCount -= 1
+                    revealed = True
+                self.indexColumn(move.sourceIndex)
+            elif move.source == Pile.Waste:
+                cards = [self.waste.pop()]
+                self.deck.removeCardFromWaste(cards[0])
+                if len(self.waste) > 0:
+                    wasteHidden = int(self.waste[-1].wasteHidden)
+                    self.waste[-1].wasteHidden = False
+            else:
+                cards = [self.foundation[move.sourceIndex].pullHighestCard()]
+                self.indexFoundation(move.sourceIndex)
+            if move.destination == Pile.Tableau:
+                self.tableau[move.destinationIndex].extend(cards)
+                self.indexColumn(move.destinationIndex)
+            else:
+                self.foundation[move.destinationIndex].addCard(cards[0])
+                self.indexFoundation(move.destinationIndex)
+            self.hashMove(move, revealed)
+            self.moves += 1
+            self.checkWin()
+        delta = MoveDelta(move, revealed, wasteVisible, wasteHidden)
+        if record:
+            self.logMove(delta)
+        return delta
 
-    def resetWaste(self):
-        self.deck.clearWaste()
-        self.waste = []
+    def logMove(self, delta: MoveDelta):
+        self.history.record(delta)
+        if self.recorder is not None:
+            self.recorder.move(delta.move)
 
+    def unapplyMove(self, delta: MoveDelta):
+        if self.indexDirty:
+            self.rebuildMoveIndex()
+        self.version += 1
+        move = delta.move
+        if move.source == Pile.Stock:
+            # Back onto the stock in the order they were drawn from it.
+            for i, card in enumerate(self.deck.undraw(move.count)):
+                card.wasteHidden = bool(delta.wasteHidden >> i & 1)
+            self.waste = self.deck.wasteTop(delta.wasteVisible)
+            self.moves -= 1
+            return
+        if move.destination == Pile.Stock:
+            self.deck.unclearWaste(move.count)
+            self.waste = self.deck.wasteTop(delta.wasteVisible)
+            return
+        self.hashMove(move, delta.revealed) # XOR undoes itself, so the same keys take the move back out.
+        if move.destination == Pile.Tableau:
+            column = self.tableau[move.destinationIndex]
+            cards = column[len(column) - move.count:]
+            del column[len(column) - move.count:]
+            self.indexColumn(move.destinationIndex)
+        else:
+            cards = [self.foundation[move.destinationIndex].pullHighestCard()]
+            self.indexFoundation(move.destinationIndex)
+        if move.source == Pile.Tableau:
+            column = self.tableau[move.sourceIndex]
+            if delta.revealed:
+                column[-1].hidden = True
+                self.hiddenCount += 1
+            column.extend(cards)
+            self.indexColumn(move.sourceIndex)
+        elif move.source == Pile.Waste:
+            if len(self.waste) > 0:
+                self.waste[-1].wasteHidden = bool(delta.wasteHidden)
+            self.waste.append(cards[0])
+            self.deck.addCardBackToWaste(cards[0])
+        else:
+            self.foundation[move.sourceIndex].addCard(cards[0])
+            self.indexFoundation(move.sourceIndex)
+        self.moves -= 1
+        self.winState = False
+        self.endTime = None
+
+    # ? Both layouts place every pile's lines into a preallocated grid of rows in one pass, then join each row once. A pile with n lines gets its cursor on row n + 1.
     def drawTop(self):
-        output = ""
         SPLIT_CHAR = "\t"
-        deck = str(self.deck).split("\n")
+        CURSOR = "           ^" + SPLIT_CHAR
+        rows = [[line, SPLIT_CHAR] for line in (DECK_EMPTY_LINES if self.deck.stockCount == 0 else DECK_LINES)[:5]]
+        for waste in range(3):
+            if len(self.waste) > waste:
+                card = self.waste[waste]
+                wasteLines = card.drawCardLines(True)
+                cursorRow = len(wasteLines) + 1 if self.cursorpos == 8 and not card.wasteHidden else -1
+                for i in range(5):
+                    if i == cursorRow:
+                        rows[i].append(CURSOR)
+                    rows[i].append(wasteLines[i] if i < len(wasteLines) else "    ")
+            else:
+                for i in range(5):
+                    rows[i].append("    ")
         for i in range(5):
-            output += deck[i] + SPLIT_CHAR
-            for waste in range(3):
-                BLANK_LINE = "       " if waste == 3 else "    "
-                if len(self.waste) > waste:
-                    wasteLine = self.waste[waste].drawCard(True).split("\n")
-                    if len(wasteLine) <= i - 1 and len(wasteLine) > i - 2 and self.cursorpos == 8 and (self.waste[waste].wasteHidden == False):
-                        output += "           ^" + SPLIT_CHAR
-                    if len(wasteLine) <= i:
-                        output += BLANK_LINE
-                    else:
-                        output += wasteLine[i]
+            rows[i].append(SPLIT_CHAR + SPLIT_CHAR)
+        for j in range(4):
+            foundation = self.foundation[j]
+            foundationLines = foundation.cards[-1].drawCardLines(True) if len(foundation.cards) > 0 else FOUNDATION_EMPTY_LINES
+            cursorRow = len(foundationLines) + 1 if self.cursorpos - 8 == j + 1 else -1
+            for i in range(5):
+                if i == cursorRow:
+                    rows[i].append(CURSOR)
+                elif i < len(foundationLines):
+                    rows[i].append(foundationLines[i] + SPLIT_CHAR)
                 else:
-                    output += BLANK_LINE
-            output += SPLIT_CHAR + SPLIT_CHAR
-            for j in range(4):
-                foundationLine = str(self.foundation[j]).split("\n")
-                if len(foundationLine) <= i-1 and len(foundationLine) > i-2 and self.cursorpos in range(9, 13) and self.cursorpos - 8 == j+1:
-                    output += "           ^" + SPLIT_CHAR
-                elif len(foundationLine) <= i:
-                    output += "       " + SPLIT_CHAR
-                else:
-                    output += foundationLine[i] + SPLIT_CHAR
-            output += "\n"
-        return output
+                    rows[i].append("       " + SPLIT_CHAR)
+        return "".join(["".join(row) + "\n" for row in rows])
 
     def drawTableau(self):
-        output = ""
         SPLIT_CHAR = "\t"
         BLANK_LINE = "       "
-        tableauStrings = []
+        self.revealTops()
+        columns = []
         for i in range(7):
-            stringOutput = ""
-            if len(self.tableau[i]) != 0:
-                if len(self.grabbedCards) == 0:
-                    self.tableau[i][-1].hidden = False # Make the top card of each tableau visible. Move to another function to keep drawing and gameplay mechanics separate?
+            column = self.tableau[i]
+            lines = []
+            if len(column) != 0:
                 if self.cursorpos == i + 1:
-                    frontCard = self.tableau[i][(self.verticalmovementpos * -1) - 1]
+                    indexOfFrontCard = len(column) - self.verticalmovementpos - 1
                 else:
-                    frontCard = self.tableau[i][-1]
-                indexOfFrontCard = self.tableau[i].index(frontCard)
-                for card in self.tableau[i]:
-                    if card == frontCard:
-                        stringOutput += card.drawCard(True) + "\n"
-                    elif self.tableau[i].index(card) > indexOfFrontCard:
-                        stringOutput += card.drawCard(below=True) + "\n"
+                    indexOfFrontCard = len(column) - 1
+                for k in range(len(column)):
+                    if k == indexOfFrontCard:
+                        lines.extend(column[k].drawCardLines(True))
+                    elif k > indexOfFrontCard:
+                        lines.extend(column[k].drawCardLines(below=True))
                     else:
-                        stringOutput += card.drawCard() + "\n"
-            tableauStrings.append(stringOutput)
-        maxLineDraw = max([len(tableau.split("\n")) for tableau in tableauStrings]) + 4
+                        lines.extend(column[k].drawCardLines())
+            lines.append("") # Each card ended with a newline, so the column always has an empty last line.
+            columns.append(lines)
+        maxLineDraw = max(len(lines) for lines in columns) + 4
         if maxLineDraw < 12:
             maxLineDraw = 12
-        for i in range(maxLineDraw):
-            for j in range(7):
-                tableauLine = tableauStrings[j].split("\n")
-                if len(tableauLine) <= i-1 and len(tableauLine) > i-2 and self.cursorpos in range(1, 8) and self.cursorpos == j+1:
-                    output += "   ^   " + SPLIT_CHAR
-                elif len(tableauLine) <= i:
-                    output += BLANK_LINE + SPLIT_CHAR
-                else:
-                    output += tableauLine[i] + SPLIT_CHAR
-            output += "\n"
-        return output
+        grid = [[BLANK_LINE] * 7 for i in range(maxLineDraw)]
+        for j in range(7):
+            lines = columns[j]
+            for i in range(len(lines)):
+                grid[i][j] = lines[i]
+            if self.cursorpos == j + 1:
+                grid[len(lines) + 1][j] = "   ^   "
+        return "".join([SPLIT_CHAR.join(row) + SPLIT_CHAR + "\n" for row in grid])
+
+    def renderedCardCount(self):
+        # Cards drawn by drawGame: shown waste, foundation tops, every tableau card and anything grabbed.
+        return len(self.waste) + sum(len(pile.cards) > 0 for pile in self.foundation) + sum(len(column) for column in self.tableau) + len(self.grabbedCards)
+
+    def frameKey(self):
+        # Everything a frame shows besides the cards: the cursor, what's held and which status line is up.
+        return (self.version, self.cursorpos, self.verticalmovementpos, len(self.grabbedCards), self.grabbedCardPos, self.winState, self.newGameState, self.statusMessage)
 
     def drawGame(self):
+        if self.printTime: # Shows the time now, never the same frame twice.
+            return self.renderFrame()
+        self.revealTops() # Drawing turns over the top cards, so do it before taking the key.
+        key = self.frameKey()
+        frame = self.frameCache.get(key)
+        if self.profiler is not None:
+            self.profiler.add("cacheHits", frame is not None)
+        if frame is None:
+            frame = self.renderFrame()
+            self.frameCache.put(key, frame)
+        if self.profiler is not None:
+            self.profiler.add("cacheBytes", self.frameCache.bytes)
+        return frame
+
+    def renderFrame(self):
+        if self.profiler is None:
+            top = self.drawTop()
+            tableau = self.drawTableau()
+        else:
+            start = time.perf_counter()
+            top = self.drawTop()
+            self.profiler.addTime("drawTop", start)
+            start = time.perf_counter()
+            tableau = self.drawTableau()
+            self.profiler.addTime("drawTableau", start)
+            self.profiler.add("cards", self.renderedCardCount())
         gameString = f"""Moves: {self.moves}\n{"Draw 3" if self.turnthree else "Draw 1"}
-{self.drawTop()}\n{self.drawTableau()}Grabbed Card(s):\n{drawGrabbedCards(self.grabbedCards)}\n"""
+{top}\n{tableau}Grabbed Card(s):\n{drawGrabbedCards(self.grabbedCards)}\n"""
         if self.printTime:
             self.printTime = False
             return gameString + f"""Time (mm:ss): {strfdelta(datetime.datetime.now() - self.startTime, "{minutes}:{seconds}")}"""
@@ -491,5 +1196,9 @@ class Game:
             return gameString + f"""You Win! Time (mm:ss): {strfdelta(self.endTime - self.startTime, "{minutes}:{seconds}")}"""
         elif self.newGameState:
             return gameString + """New Game? Y/N"""
+        elif self.statusMessage:
+            return gameString + self.statusMessage
+        elif self.canAutoComplete():
+            return gameString + """Every card is face up. A to auto-complete, or keep playing."""
         else:
-            return gameString + """D to draw, R to reset waste, C to grab, V to place, F to auto-move to foundation, T to print time, Q to quit, N for new game."""
+            return gameString + """D to draw, R to reset waste, C to grab, V to place, F to auto-move to foundation, U to undo (Shift+U to redo), H for a hint, T to print time, Q to quit, N for new game."""
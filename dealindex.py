@@ -0,0 +1,140 @@
+import argparse
+import csv
+import json
+import mmap
+import os
+import random
+import struct
+import sys
+from paths import dataDir
+
+# ? On-disk index of analyzed deals (see analyze.py), memory-mapped so nothing is parsed at startup.
+# Layout: header, section table, then fixed 8-byte records (seed, draw, outcome, solution length).
+# Winnable deals come first, grouped by draw mode and difficulty, so a section is a contiguous run of records and picking a deal from it is one random index.
+# Difficulty is thirds by solver effort (analyze.py's nodes), not solution length: the solver keeps the first solution its depth-first search finds (with detours cut out, but not a shortest one), whose length says little about the deal.
+MAGIC = b"SOLD"
+VERSION = 1
+HEADER = struct.Struct("<4sBxxxI")
+SECTIONS = struct.Struct("<12I") # (start, count) for draw 1 easy/medium/hard, then draw 3.
+RECORD = struct.Struct("<IBBH")
+RECORDS_OFFSET = HEADER.size + SECTIONS.size
+
+OUTCOMES = {"no": 0, "yes": 1, "unknown": 2}
+DIFFICULTIES = ["easy", "medium", "hard"]
+
+def defaultPath():
+    return os.environ.get("SOLITAIRE_DEAL_INDEX", os.path.join(dataDir(), "deals.idx"))
+
+class DealIndex:
+    def __init__(self, path: str = None):
+        self.path = path or defaultPath()
+        with open(self.path, "rb") as file:
+            self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.count = HEADER.unpack_from(self.map)
+        if magic != MAGIC or version != VERSION:
+            self.map.close()
+            raise ValueError(f"{self.path} is not a version {VERSION} deal index")
+        sections = SECTIONS.unpack_from(self.map, HEADER.size)
+        self.sections = [(sections[i], sections[i + 1]) for i in range(0, 12, 2)]
+
+    def record(self, i: int):
+        # (seed, draw, outcome, solution length)
+        return RECORD.unpack_from(self.map, RECORDS_OFFSET + i * RECORD.size)
+
+    def winnableCount(self, turnthree: bool, difficulty: int = None):
+        base = 3 if turnthree else 0
+        if difficulty is None:
+            return sum(count for start, count in self.sections[base:base + 3])
+        return self.sections[base + difficulty][1]
+
+    def randomWinnable(self, turnthree: bool, difficulty: int = None, rng = random):
+        # A random winnable seed for the draw mode, optionally of one difficulty (index into DIFFICULTIES). None if there isn't one.
+        base = 3 if turnthree else 0
+        if difficulty is None:
+            total = self.winnableCount(turnthree)
+            if total == 0:
+                return None
+            pick = rng.randrange(total)
+            for start, count in self.sections[base:base + 3]:
+                if pick < count:
+                    return self.record(start + pick)[0]
+                pick -= count
+        start, count = self.sections[base + difficulty]
+        if count == 0:
+            return None
+        return self.record(start + rng.randrange(count))[0]
+
+    def close(self):
+        self.map.close()
+
+def readRows(paths):
+    # Rows as written by analyze.py, CSV or JSONL.
+    for path in paths:
+        with open(path, newline="", encoding="utf-8") as file:
+            if path.endswith(".jsonl"):
+                for line in file:
+                    if line.strip():
+                        yield json.loads(line)
+            else:
+                yield from csv.DictReader(file)
+
+def buildIndex(rows, path: str):
+    winnable = {1: [], 3: []}
+    others = []
+    seen = set()
+    for row in rows:
+        seed, draw, outcome = int(row["deal"]), int(row["draw"]), OUTCOMES[row["winnable"]]
+        if (seed, draw) in seen:
+            continue
+        seen.add((seed, draw))
+        length = int(row["solution_length"]) if outcome == 1 and row["solution_length"] not in (None, "") else 0
+        if outcome == 1:
+            winnable[draw].append((int(row.get("nodes") or 0), length, seed))
+        else:
+            others.append((seed, draw, outcome, 0))
+    sections = []
+    records = []
+    for draw in (1, 3):
+        deals = sorted(winnable[draw])
+        for i in range(3):
+            chunk = deals[len(deals) * i // 3:len(deals) * (i + 1) // 3]
+            sections += [len(records), len(chunk)]
+            records += [(seed, draw, 1, min(length, 0xFFFF)) for nodes, length, seed in chunk]
+    records += sorted(others)
+    with open(path + ".tmp", "wb") as file:
+        file.write(HEADER.pack(MAGIC, VERSION, len(records)))
+        file.write(SECTIONS.pack(*sections))
+        for record in records:
+            file.write(RECORD.pack(*record))
+    os.replace(path + ".tmp", path)
+    return len(records)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or inspect the winnable deal index used by the game menu.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build = subparsers.add_parser("build", help="Build the index from analyze.py output files.")
+    build.add_argument("results", nargs="+", help="CSV or JSONL files written by analyze.py.")
+    build.add_argument("--output", default=None, help="Index file. Default is deals.idx in the data directory, or SOLITAIRE_DEAL_INDEX.")
+    info = subparsers.add_parser("info", help="Show what an index contains.")
+    info.add_argument("path", nargs="?", default=None)
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        path = args.output or defaultPath()
+        count = buildIndex(readRows(args.results), path)
+        print(f"Wrote {count} deals to {path}.")
+    else:
+        try:
+            index = DealIndex(args.path)
+        except (OSError, ValueError) as error:
+            print(error, file=sys.stderr)
+            sys.exit(1)
+        print(f"{index.path}: {index.count} deals.")
+        for turnthree in (False, True):
+            counts = ", ".join(f"{index.winnableCount(turnthree, i)} {name}" for i, name in enumerate(DIFFICULTIES))
+            print(f"Draw {3 if turnthree else 1} winnable: {counts}.")
+        index.close()
+
+# Init.
+if __name__ == "__main__":
+    main()
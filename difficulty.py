@@ -0,0 +1,192 @@
+import argparse
+import sys
+import time
+import numpy as np
+from classes import MAX_SEED
+from environment import DEAL_COLUMN, DEAL_POSITION, DEAL_SOURCE, RANKS, REDS, shuffledDeck
+
+# ? Static difficulty estimates for huge ranges of deals, to pick candidates before solving any (analyze.py --deals).
+# Deals are built a chunk at a time entirely in NumPy: random.Random(seed).shuffle is Python's Mersenne Twister, so its seeding, output and rejection sampling are redone here across every seed of the chunk at once, giving exactly Deck.shuffle's order.
+# Memory is about chunk * 2.6 KB (the generator state), whatever the range. Score: lower is easier. It's a heuristic from the layout alone, no play is tried.
+# Usage: python difficulty.py 0 10000000 --draw 3 --output scores.npy --max-score 0 --deals easy.txt
+
+# Mersenne Twister (MT19937) as in CPython's _randommodule.c.
+MT_SIZE = 624
+MT_SHIFT = 397
+MT_OUTPUTS = MT_SIZE - MT_SHIFT # Outputs of the first twist that only need the seeded state. A shuffle of 52 takes about 70.
+MATRIX_A = np.uint32(0x9908B0DF)
+UPPER_MASK = np.uint32(0x80000000)
+LOWER_MASK = np.uint32(0x7FFFFFFF)
+
+FEATURES = ["buriedAces", "buriedLow", "blockedKings", "sameColor", "unreachableLow", "openingMoves"]
+WEIGHTS = np.array([3, 1, 1.5, 0.5, 2, -2], np.float32) # Per feature, see dealFeatures. A starting point, not fitted; --weights to try others.
+
+# Tableau layout of DEAL_SOURCE: cards lying on top of each card, the face-up tops, and every card with the one directly on it.
+ABOVE = DEAL_COLUMN - DEAL_POSITION
+TOPS = np.flatnonzero(ABOVE == 0)
+PAIR_BELOW = np.flatnonzero(ABOVE > 0)
+PAIR_ABOVE = PAIR_BELOW + 1
+# Stock positions (the first 24 of the shuffled deck, drawn from the end) a draw 3 pass turns up without playing any of them.
+STOCK_SIZE = 24
+REACHABLE = {1: np.arange(STOCK_SIZE), 3: np.arange(STOCK_SIZE - 3, -1, -3)}
+
+def initialState():
+    # init_genrand(19650218), the same for every seed.
+    state = [19650218]
+    for i in range(1, MT_SIZE):
+        state.append((1812433253 * (state[-1] ^ state[-1] >> 30) + i) & 0xFFFFFFFF)
+    return np.array(state, np.uint32)
+
+INITIAL_STATE = initialState()
+
+def seededStates(seeds: np.ndarray):
+    # init_by_array with each seed as the one word key, as random.seed does for seeds below 2 ** 32. Rows are state words, columns seeds.
+    key = seeds.astype(np.uint32)
+    state = np.repeat(INITIAL_STATE[:, None], len(seeds), axis=1)
+    mixed = np.empty(len(seeds), np.uint32)
+    i = 1
+    for phase, multiplier in ((MT_SIZE, np.uint32(1664525)), (MT_SIZE - 1, np.uint32(1566083941))):
+        for k in range(phase):
+            np.right_shift(state[i - 1], 30, out=mixed)
+            np.bitwise_xor(mixed, state[i - 1], out=mixed)
+            np.multiply(mixed, multiplier, out=mixed)
+            np.bitwise_xor(state[i], mixed, out=state[i])
+            if phase == MT_SIZE:
+                np.add(state[i], key, out=state[i])
+            else:
+                np.subtract(state[i], np.uint32(i), out=state[i])
+            i += 1
+            if i >= MT_SIZE:
+                state[0] = state[MT_SIZE - 1]
+                i = 1
+    state[0] = UPPER_MASK
+    return state
+
+def firstOutputs(state: np.ndarray):
+    # The first MT_OUTPUTS 32-bit outputs after seeding, tempered.
+    y = (state[:MT_OUTPUTS] & UPPER_MASK) | (state[1:MT_OUTPUTS + 1] & LOWER_MASK)
+    y = state[MT_SHIFT:] ^ (y >> 1) ^ ((y & 1) * MATRIX_A)
+    y ^= y >> 11
+    y ^= (y << 7) & np.uint32(0x9D2C5680)
+    y ^= (y << 15) & np.uint32(0xEFC60000)
+    y ^= y >> 18
+    return y
+
+def shuffledDecks(seeds: np.ndarray):
+    # Card indexes in Deck.shuffle order for every seed, one row each: shuffledDeck without the Python loop.
+    outputs = firstOutputs(seededStates(seeds))
+    count = len(seeds)
+    decks = np.tile(np.arange(52, dtype=np.int8), (count, 1))
+    rows = np.arange(count)
+    used = np.zeros(count, np.intp)
+    overflow = np.zeros(count, bool)
+
+    def getrandbits(which, shift):
+        index = used[which]
+        exhausted = index >= MT_OUTPUTS
+        overflow[which[exhausted]] = True
+        values = outputs[np.minimum(index, MT_OUTPUTS - 1), which] >> np.uint32(shift)
+        values[exhausted] = 0
+        used[which] += 1
+        return values
+
+    # random.shuffle: for each i from the end, swap with _randbelow(i + 1), which retries getrandbits(k) until it's below i + 1.
+    for i in range(51, 0, -1):
+        shift = 32 - (i + 1).bit_length()
+        j = getrandbits(rows, shift)
+        rejected = np.flatnonzero(j > i)
+        while len(rejected) > 0:
+            j[rejected] = getrandbits(rejected, shift)
+            rejected = rejected[j[rejected] > i]
+        swapped = decks[rows, j]
+        decks[rows, j] = decks[:, i]
+        decks[:, i] = swapped
+    for row in np.flatnonzero(overflow):
+        decks[row] = shuffledDeck(int(seeds[row]))
+    return decks
+
+def dealFeatures(decks: np.ndarray, turnthree: bool):
+    # One row per deal, columns as FEATURES:
+    # buriedAces, buriedLow: cards lying on the tableau aces, and on the twos and threes.
+    # blockedKings: cards under tableau kings, which only an empty column frees.
+    # sameColor: cards lying directly on a card of the same color, so never built on it.
+    # unreachableLow: aces and twos in the stock that the first pass doesn't turn up (draw 3).
+    # openingMoves: face-up aces, tops that fit on another top, and reachable stock cards that are aces or fit on a top.
+    tableau = decks[:, DEAL_SOURCE]
+    ranks = RANKS[tableau]
+    reds = REDS[tableau]
+    features = np.empty((len(decks), len(FEATURES)), np.int16)
+    features[:, 0] = ((ranks == 1) * ABOVE).sum(1)
+    features[:, 1] = (((ranks == 2) | (ranks == 3)) * ABOVE).sum(1)
+    features[:, 2] = ((ranks == 13) * DEAL_POSITION).sum(1)
+    features[:, 3] = (reds[:, PAIR_BELOW] == reds[:, PAIR_ABOVE]).sum(1)
+    stockRanks = RANKS[decks[:, :STOCK_SIZE]]
+    reachable = REACHABLE[3 if turnthree else 1]
+    unreachable = np.ones(STOCK_SIZE, bool)
+    unreachable[reachable] = False
+    features[:, 4] = (stockRanks[:, unreachable] <= 2).sum(1)
+    topRanks, topReds = ranks[:, TOPS], reds[:, TOPS]
+    stockRanks, stockReds = stockRanks[:, reachable], REDS[decks[:, reachable]]
+    topFits = (topRanks[:, :, None] + 1 == topRanks[:, None, :]) & (topReds[:, :, None] != topReds[:, None, :])
+    stockFits = ((stockRanks[:, :, None] + 1 == topRanks[:, None, :]) & (stockReds[:, :, None] != topReds[:, None, :])).any(2)
+    features[:, 5] = (topRanks == 1).sum(1) + topFits.sum((1, 2)) + (stockFits | (stockRanks == 1)).sum(1)
+    return features
+
+def scoreDeals(features: np.ndarray, weights: np.ndarray = WEIGHTS):
+    return features.astype(np.float32) @ weights
+
+def scoreRange(start: int, end: int, turnthree: bool, chunk: int = 16384, weights: np.ndarray = WEIGHTS):
+    # Yields (first deal, scores) a chunk at a time.
+    for first in range(start, end, chunk):
+        seeds = np.arange(first, min(first + chunk, end), dtype=np.int64)
+        yield first, scoreDeals(dealFeatures(shuffledDecks(seeds), turnthree), weights)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Estimate how hard a range of deals is from the layout alone, vectorized over chunks of deals.")
+    parser.add_argument("start", type=int, help="First deal number.")
+    parser.add_argument("end", type=int, help="Last deal number (exclusive).")
+    parser.add_argument("--draw", type=int, choices=[1, 3], default=1, help="Draw 1 or draw 3.")
+    parser.add_argument("--chunk", type=int, default=16384, help="Deals per batch; memory is about 2.6 KB per deal.")
+    parser.add_argument("--output", default=None, help="Write every score to this .npy file, index 0 being the first deal.")
+    parser.add_argument("--max-score", type=float, default=None, help="With --deals, keep deals scoring at most this.")
+    parser.add_argument("--deals", default=None, help="Write the deal numbers kept by --max-score here, one per line, for analyze.py --deals.")
+    parser.add_argument("--weights", default=None, help=f"Comma-separated weights for {', '.join(FEATURES)}.")
+    args = parser.parse_args(argv)
+    if not 0 <= args.start <= args.end <= MAX_SEED:
+        parser.error(f"Deals are numbered 0 to {MAX_SEED - 1}.")
+    weights = WEIGHTS
+    if args.weights:
+        weights = np.array([float(weight) for weight in args.weights.split(",")], np.float32)
+        if len(weights) != len(FEATURES):
+            parser.error(f"--weights needs {len(FEATURES)} values.")
+
+    output = np.lib.format.open_memmap(args.output, "w+", np.float32, (args.end - args.start,)) if args.output else None
+    deals = open(args.deals, "w", encoding="utf-8") if args.deals else None
+    maxScore = args.max_score if args.max_score is not None else np.inf
+    sample = []
+    kept = 0
+    started = time.perf_counter()
+    for first, scores in scoreRange(args.start, args.end, args.draw == 3, args.chunk, weights):
+        if output is not None:
+            output[first - args.start:first - args.start + len(scores)] = scores
+        if deals is not None:
+            selected = np.flatnonzero(scores <= maxScore) + first
+            deals.write("".join(f"{deal}\n" for deal in selected))
+            kept += len(selected)
+        sample.append(scores[:1000])
+        done = first + len(scores) - args.start
+        elapsed = time.perf_counter() - started
+        print(f"\r{done} deals, {done / elapsed:.0f} deals/s.", end="", file=sys.stderr)
+    print(file=sys.stderr)
+    if output is not None:
+        output.flush()
+    if deals is not None:
+        deals.close()
+        print(f"{kept} deals kept.", file=sys.stderr)
+    if len(sample) > 0:
+        percentiles = np.percentile(np.concatenate(sample), [1, 10, 50, 90, 99])
+        print("Score percentiles (1, 10, 50, 90, 99): " + ", ".join(f"{value:.1f}" for value in percentiles), file=sys.stderr)
+
+# Init.
+if __name__ == "__main__":
+    main()
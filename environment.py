@@ -0,0 +1,370 @@
+import argparse
+import random
+import time
+import numpy as np
+from classes import RANK, RED, SUIT, Game, Pile, MAX_SEED
+
+# ? Gym-style environments for bots: reset(seed) -> (observation, info), step(action) -> (observation, reward, terminated, truncated, info), with info["mask"] flagging the legal actions.
+# SolitaireEnv plays one Game through legalMoves/applyMove. BatchSolitaireEnv plays N deals at once with the whole state in NumPy arrays, following the same rules (and giving the same observations and masks) without any Card or Game objects.
+# Needs numpy; the game itself doesn't.
+# Usage: python environment.py --games 100000 --batch 4096 --draw 3
+
+# ? Actions. Moves to a foundation don't name a slot, the card goes where Game.foundationFor would put it. Tableau to tableau moves the one run that fits the destination, so the count is implied.
+DRAW = 0
+RESET = 1
+WASTE_TO_FOUNDATION = 2
+TABLEAU_TO_FOUNDATION = 3 # + source column
+WASTE_TO_TABLEAU = 10 # + destination column
+FOUNDATION_TO_TABLEAU = 17 # + source slot * 7 + destination column
+TABLEAU_TO_TABLEAU = 45 # + source column * 7 + destination column (never legal onto itself)
+ACTION_COUNT = 94
+
+# Observation: every column bottom to top (HIDDEN_CARD when face down, EMPTY past the end), foundation rank and suit per slot, the visible waste bottom to top, stock size, waste size. int8.
+MAX_COLUMN = 19 # 6 face down cards under a King to Ace run.
+OBSERVATION_SIZE = 7 * MAX_COLUMN + 4 + 4 + 3 + 2
+HIDDEN_CARD = 52
+EMPTY = -1
+
+# Card index tables (see Card.index) with one extra entry, so EMPTY (-1) looks up as rank 0.
+RANKS = np.array(RANK + (0,), np.int16)
+SUITS = np.array(SUIT + (0,), np.int16)
+REDS = np.array(RED + (False,))
+
+STOCK, WASTE, TABLEAU, FOUNDATION = range(4)
+ACTION_SOURCE = np.array([STOCK, WASTE, WASTE] + [TABLEAU] * 7 + [WASTE] * 7 + [FOUNDATION] * 28 + [TABLEAU] * 49, np.int8)
+ACTION_SOURCE_INDEX = np.array([0, 0, 0] + list(range(7)) + [0] * 7 + [i // 7 for i in range(28)] + [i // 7 for i in range(49)], np.int16)
+ACTION_DESTINATION = np.array([WASTE, STOCK] + [FOUNDATION] * 8 + [TABLEAU] * 84, np.int8)
+ACTION_DESTINATION_INDEX = np.array([0] * 10 + list(range(7)) + [i % 7 for i in range(28)] + [i % 7 for i in range(49)], np.int16)
+
+# Where Deck.draw puts each card of a shuffled deck when Game deals: column i, position p comes from shuffled position 51 - (i * (i + 1) / 2 + p). The first 24 stay in the stock.
+DEAL_COLUMN = np.array([i for i in range(7) for p in range(i + 1)], np.intp)
+DEAL_POSITION = np.array([p for i in range(7) for p in range(i + 1)], np.intp)
+DEAL_SOURCE = 51 - (DEAL_COLUMN * (DEAL_COLUMN + 1) // 2 + DEAL_POSITION)
+
+def moveToAction(move):
+    if move.source == Pile.Stock:
+        return DRAW
+    elif move.destination == Pile.Stock:
+        return RESET
+    elif move.destination == Pile.Foundation:
+        return WASTE_TO_FOUNDATION if move.source == Pile.Waste else TABLEAU_TO_FOUNDATION + move.sourceIndex
+    elif move.source == Pile.Waste:
+        return WASTE_TO_TABLEAU + move.destinationIndex
+    elif move.source == Pile.Foundation:
+        return FOUNDATION_TO_TABLEAU + move.sourceIndex * 7 + move.destinationIndex
+    return TABLEAU_TO_TABLEAU + move.sourceIndex * 7 + move.destinationIndex
+
+def shuffledDeck(seed: int):
+    # Card indexes in the order Deck.shuffle(seed) leaves the cards.
+    order = list(range(52))
+    random.Random(seed).shuffle(order)
+    return order
+
+def randomActions(mask, rng):
+    # A uniformly random legal action per row of a (N, ACTION_COUNT) mask.
+    return np.argmax(rng.random(mask.shape) * mask, axis=1)
+
+class SolitaireEnv:
+    def __init__(self, turnthree: bool = False, maxSteps: int = 1000):
+        self.turnthree = turnthree
+        self.maxSteps = maxSteps
+        self.game = None
+        self.actions = {}
+        self.steps = 0
+
+    def reset(self, seed: int = None):
+        self.game = Game(self.turnthree, seed)
+        self.game.revealTops()
+        self.steps = 0
+        self.actions = {moveToAction(move): move for move in self.game.legalMoves()}
+        return self.observation(), {"seed": self.game.seed, "mask": self.legalMask()}
+
+    def legalMask(self):
+        mask = np.zeros(ACTION_COUNT, bool)
+        mask[list(self.actions)] = True
+        return mask
+
+    def foundationCards(self):
+        return sum(len(pile.cards) for pile in self.game.foundation)
+
+    def step(self, action: int):
+        # An illegal action changes nothing and is flagged in info["illegal"].
+        move = self.actions.get(int(action))
+        self.steps += 1
+        reward = 0
+        if move is not None:
+            before = self.foundationCards()
+            self.game.applyMove(move, False)
+            self.actions = {moveToAction(move): move for move in self.game.legalMoves()}
+            reward = self.foundationCards() - before
+        terminated = self.game.winState or len(self.actions) == 0
+        truncated = not terminated and self.steps >= self.maxSteps
+        return self.observation(), reward, terminated, truncated, {"mask": self.legalMask(), "illegal": move is None, "won": self.game.winState}
+
+    def observation(self):
+        game = self.game
+        output = np.full(OBSERVATION_SIZE, EMPTY, np.int8)
+        for i, column in enumerate(game.tableau):
+            for k, card in enumerate(column):
+                output[i * MAX_COLUMN + k] = HIDDEN_CARD if card.hidden else card.index
+        offset = 7 * MAX_COLUMN
+        for slot, pile in enumerate(game.foundation):
+            output[offset + slot] = len(pile.cards)
+            if len(pile.cards) > 0:
+                output[offset + 4 + slot] = pile.cards[-1].index // 13
+        offset += 8
+        for i, card in enumerate(game.waste):
+            output[offset + i] = card.index
+        output[offset + 3] = game.deck.stockCount
+        output[offset + 4] = game.deck.wasteCount
+        return output
+
+# ? N games stepped together. Piles are fixed-size card index arrays plus lengths; the stock and waste keep Deck.cards/Deck.removed_cards order and visible is len(Game.waste), the part of the waste that can be played.
+# Every step handles each kind of action for all the games taking it at once, so the Python overhead is per step, not per game.
+class BatchSolitaireEnv:
+    def __init__(self, count: int, turnthree: bool = False, maxSteps: int = 1000):
+        self.count = count
+        self.turnthree = turnthree
+        self.drawCount = 3 if turnthree else 1
+        self.maxSteps = maxSteps
+        self.rows = np.arange(count)
+        self.tableau = np.full((count, 7, MAX_COLUMN), EMPTY, np.int8)
+        self.length = np.zeros((count, 7), np.int16)
+        self.hidden = np.zeros((count, 7), np.int16) # Face down cards at the bottom of each column.
+        self.foundationSuit = np.full((count, 4), EMPTY, np.int16) # Per slot.
+        self.foundationRank = np.zeros((count, 4), np.int16) # Per slot, 0 when empty.
+        self.suitRank = np.zeros((count, 4), np.int16)
+        self.suitSlot = np.full((count, 4), EMPTY, np.int16)
+        self.stock = np.full((count, 24), EMPTY, np.int8)
+        self.stockLen = np.zeros(count, np.int16)
+        self.waste = np.full((count, 24), EMPTY, np.int8)
+        self.wasteLen = np.zeros(count, np.int16)
+        self.visible = np.zeros(count, np.int16)
+        self.moves = np.zeros(count, np.int32)
+        self.steps = np.zeros(count, np.int32)
+        self.seeds = np.zeros(count, np.int64)
+        self.runStart = np.zeros((count, 7, 7), np.int16) # From legalMask: where the run moving from column i to column j starts.
+
+    def reset(self, seeds = None, mask = None):
+        # Deals Game(turnthree, seed) into every game, or only where mask is set. seeds has one entry per game dealt, random if not given.
+        envs = self.rows if mask is None else np.flatnonzero(mask)
+        if seeds is None:
+            seeds = [random.randrange(MAX_SEED) for i in range(len(envs))]
+        decks = np.array([shuffledDeck(int(seed)) for seed in seeds], np.int8).reshape(len(envs), 52)
+        self.seeds[envs] = seeds
+        self.tableau[envs] = EMPTY
+        self.tableau[envs[:, None], DEAL_COLUMN, DEAL_POSITION] = decks[:, DEAL_SOURCE]
+        self.length[envs] = np.arange(1, 8)
+        self.hidden[envs] = np.arange(7)
+        self.foundationSuit[envs] = EMPTY
+        self.foundationRank[envs] = 0
+        self.suitRank[envs] = 0
+        self.suitSlot[envs] = EMPTY
+        self.stock[envs] = decks[:, :24]
+        self.stockLen[envs] = 24
+        self.waste[envs] = EMPTY
+        self.wasteLen[envs] = 0
+        self.visible[envs] = 0
+        self.moves[envs] = 0
+        self.steps[envs] = 0
+        return self.observation(), {"seeds": self.seeds.copy(), "mask": self.legalMask()}
+
+    def tops(self):
+        return np.where(self.length > 0, self.tableau[self.rows[:, None], np.arange(7), np.maximum(self.length - 1, 0)], EMPTY)
+
+    def fitsFoundation(self, cards):
+        # cards is (N,) or (N, k) card indexes.
+        shape = cards.shape
+        cards = cards.reshape(self.count, -1)
+        rank = np.take_along_axis(self.suitRank, SUITS[cards], axis=1)
+        return ((cards >= 0) & (rank == RANKS[cards] - 1)).reshape(shape)
+
+    def legalMask(self):
+        # Same moves as Game.legalMoves, as a (N, ACTION_COUNT) bool array.
+        count = self.count
+        tops = self.tops()
+        wasteTop = np.where(self.visible > 0, self.waste[self.rows, np.maximum(self.wasteLen - 1, 0)], EMPTY)
+        foundationTops = np.where(self.foundationRank > 0, self.foundationSuit * 13 + self.foundationRank - 1, EMPTY)
+        mask = np.zeros((count, ACTION_COUNT), bool)
+        mask[:, DRAW] = self.stockLen > 0
+        mask[:, RESET] = self.wasteLen > 0
+        mask[:, WASTE_TO_FOUNDATION] = self.fitsFoundation(wasteTop)
+        mask[:, TABLEAU_TO_FOUNDATION:TABLEAU_TO_FOUNDATION + 7] = self.fitsFoundation(tops)
+        mask[:, WASTE_TO_TABLEAU:WASTE_TO_TABLEAU + 7] = fitsColumn(wasteTop[:, None], tops)
+        mask[:, FOUNDATION_TO_TABLEAU:FOUNDATION_TO_TABLEAU + 28] = fitsColumn(foundationTops[:, :, None], tops[:, None, :]).reshape(count, 28)
+        # Face up cards in a column are always a run, so the card of the rank column j wants sits a fixed distance below the top of column i.
+        topRank = RANKS[tops]
+        wanted = np.where(tops >= 0, topRank - 1, 13)
+        start = self.length[:, :, None] - 1 - (wanted[:, None, :] - topRank[:, :, None])
+        valid = (self.length[:, :, None] > 0) & (wanted[:, None, :] >= topRank[:, :, None]) & (start >= self.hidden[:, :, None])
+        cards = self.tableau[self.rows[:, None, None], np.arange(7)[None, :, None], np.clip(start, 0, MAX_COLUMN - 1)]
+        valid &= fitsColumn(np.where(valid, cards, EMPTY), tops[:, None, :])
+        valid[:, np.arange(7), np.arange(7)] = False
+        mask[:, TABLEAU_TO_TABLEAU:] = valid.reshape(count, 49)
+        self.runStart = start
+        return mask
+
+    def step(self, actions):
+        # One action per game. Illegal actions change nothing and are flagged in info["illegal"]. Finished games keep stepping until they're reset.
+        actions = np.asarray(actions, np.intp)
+        legal = self.legalMask()[self.rows, actions]
+        envs = np.flatnonzero(legal)
+        kinds = actions[envs]
+        rewards = np.zeros(self.count, np.int16)
+        self.draw(envs[kinds == DRAW])
+        self.resetWaste(envs[kinds == RESET])
+        moving = envs[kinds >= WASTE_TO_FOUNDATION]
+        self.moveCards(moving, actions[moving], rewards)
+        self.moves[envs[kinds != RESET]] += 1
+        self.steps += 1
+        mask = self.legalMask()
+        won = (self.suitRank == 13).all(axis=1)
+        terminated = won | ~mask.any(axis=1)
+        truncated = ~terminated & (self.steps >= self.maxSteps)
+        return self.observation(), rewards, terminated, truncated, {"mask": mask, "illegal": ~legal, "won": won}
+
+    def draw(self, envs):
+        count = np.minimum(self.drawCount, self.stockLen[envs])
+        for r in range(self.drawCount):
+            e = envs[r < count]
+            self.waste[e, self.wasteLen[e] + r] = self.stock[e, self.stockLen[e] - 1 - r]
+            self.stock[e, self.stockLen[e] - 1 - r] = EMPTY
+        self.stockLen[envs] -= count
+        self.wasteLen[envs] += count
+        self.visible[envs] = count
+
+    def resetWaste(self, envs):
+        # The whole waste goes back under the stock, reversed, like Deck.clearWaste.
+        for r in range(24):
+            e = envs[r < self.wasteLen[envs]]
+            if len(e) == 0:
+                break
+            self.stock[e, self.stockLen[e] + r] = self.waste[e, self.wasteLen[e] - 1 - r]
+        self.waste[envs] = EMPTY
+        self.stockLen[envs] += self.wasteLen[envs]
+        self.wasteLen[envs] = 0
+        self.visible[envs] = 0
+
+    def moveCards(self, envs, actions, rewards):
+        source = ACTION_SOURCE[actions]
+        sourceIndex = ACTION_SOURCE_INDEX[actions]
+        destination = ACTION_DESTINATION[actions]
+        destinationIndex = ACTION_DESTINATION_INDEX[actions]
+        count = np.ones(len(envs), np.int16)
+        runs = (source == TABLEAU) & (destination == TABLEAU)
+        count[runs] = self.length[envs[runs], sourceIndex[runs]] - self.runStart[envs[runs], sourceIndex[runs], destinationIndex[runs]]
+        cards = np.full((len(envs), 13), EMPTY, np.int16)
+
+        rows = np.flatnonzero(source == WASTE)
+        e = envs[rows]
+        cards[rows, 0] = self.waste[e, self.wasteLen[e] - 1]
+        self.waste[e, self.wasteLen[e] - 1] = EMPTY
+        self.wasteLen[e] -= 1
+        self.visible[e] -= 1
+
+        rows = np.flatnonzero(source == FOUNDATION)
+        e = envs[rows]
+        slot = sourceIndex[rows]
+        suit = self.foundationSuit[e, slot]
+        cards[rows, 0] = suit * 13 + self.foundationRank[e, slot] - 1
+        self.foundationRank[e, slot] -= 1
+        self.suitRank[e, suit] -= 1
+        emptied = self.foundationRank[e, slot] == 0
+        self.foundationSuit[e[emptied], slot[emptied]] = EMPTY
+        self.suitSlot[e[emptied], suit[emptied]] = EMPTY
+        rewards[e] -= 1
+
+        rows = np.flatnonzero(source == TABLEAU)
+        e = envs[rows]
+        column = sourceIndex[rows]
+        first = self.length[e, column] - count[rows]
+        for r in range(13):
+            taking = r < count[rows]
+            if not taking.any():
+                break
+            cards[rows[taking], r] = self.tableau[e[taking], column[taking], first[taking] + r]
+            self.tableau[e[taking], column[taking], first[taking] + r] = EMPTY
+        self.length[e, column] = first
+        self.hidden[e, column] = np.minimum(self.hidden[e, column], np.maximum(first - 1, 0)) # Turn over the new top.
+
+        rows = np.flatnonzero(destination == TABLEAU)
+        e = envs[rows]
+        column = destinationIndex[rows]
+        first = self.length[e, column]
+        for r in range(13):
+            placing = r < count[rows]
+            if not placing.any():
+                break
+            self.tableau[e[placing], column[placing], first[placing] + r] = cards[rows[placing], r]
+        self.length[e, column] = first + count[rows]
+
+        rows = np.flatnonzero(destination == FOUNDATION)
+        e = envs[rows]
+        card = cards[rows, 0]
+        suit = SUITS[card]
+        # Aces start the first empty slot, like Game.foundationFor.
+        slot = np.where(self.suitSlot[e, suit] >= 0, self.suitSlot[e, suit], np.argmax(self.foundationSuit[e] == EMPTY, axis=1))
+        self.foundationSuit[e, slot] = suit
+        self.suitSlot[e, suit] = slot
+        self.foundationRank[e, slot] += 1
+        self.suitRank[e, suit] += 1
+        rewards[e] += 1
+
+    def observation(self):
+        count = self.count
+        output = np.empty((count, OBSERVATION_SIZE), np.int8)
+        tableau = np.where(np.arange(MAX_COLUMN) < self.hidden[:, :, None], HIDDEN_CARD, self.tableau)
+        output[:, :7 * MAX_COLUMN] = tableau.reshape(count, -1)
+        offset = 7 * MAX_COLUMN
+        output[:, offset:offset + 4] = self.foundationRank
+        output[:, offset + 4:offset + 8] = self.foundationSuit
+        offset += 8
+        for i in range(3):
+            position = self.wasteLen - self.visible + i
+            output[:, offset + i] = np.where(i < self.visible, self.waste[self.rows, np.clip(position, 0, 23)], EMPTY)
+        output[:, offset + 3] = self.stockLen
+        output[:, offset + 4] = self.wasteLen
+        return output
+
+def fitsColumn(cards, tops):
+    # Whether each card can go on a column with that top card (EMPTY for an empty column). Broadcasts.
+    return (cards >= 0) & np.where(tops >= 0, (RANKS[cards] == RANKS[tops] - 1) & (REDS[cards] != REDS[tops]), RANKS[cards] == 13)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Play seeded deals with a random policy in a batched environment and report the win rate.")
+    parser.add_argument("--games", type=int, default=10000, help="Deals to play.")
+    parser.add_argument("--batch", type=int, default=1024, help="Games stepped at once.")
+    parser.add_argument("--draw", type=int, choices=[1, 3], default=1, help="Draw 1 or draw 3.")
+    parser.add_argument("--start", type=int, default=0, help="First deal number; deals are played in order from here.")
+    parser.add_argument("--max-steps", type=int, default=1000, help="Steps before a game is cut off.")
+    args = parser.parse_args(argv)
+
+    batch = min(args.batch, args.games)
+    env = BatchSolitaireEnv(batch, args.draw == 3, args.max_steps)
+    rng = np.random.default_rng(args.start)
+    nextDeal = args.start + batch
+    lastDeal = args.start + args.games
+    observation, info = env.reset(np.arange(args.start, nextDeal))
+    active = np.ones(batch, bool)
+    played = wins = steps = 0
+    start = time.perf_counter()
+    while active.any():
+        observation, rewards, terminated, truncated, info = env.step(randomActions(info["mask"], rng))
+        steps += int(active.sum())
+        finished = (terminated | truncated) & active
+        played += int(finished.sum())
+        wins += int((finished & info["won"]).sum())
+        redeal = np.flatnonzero(finished)[:max(lastDeal - nextDeal, 0)]
+        active[finished] = False
+        if len(redeal) > 0:
+            mask = np.zeros(batch, bool)
+            mask[redeal] = True
+            observation, info = env.reset(np.arange(nextDeal, nextDeal + len(redeal)), mask)
+            active[redeal] = True
+            nextDeal += len(redeal)
+    elapsed = time.perf_counter() - start
+    print(f"{played} draw {args.draw} games, {wins} won ({wins / max(played, 1):.2%}). {steps} steps at {steps / elapsed:.0f} steps/s.")
+
+# Init.
+if __name__ == "__main__":
+    main()
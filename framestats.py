@@ -0,0 +1,85 @@
+import json
+import os
+import time
+from collections import deque
+from paths import dataDir
+
+# ? Per-frame timings and counters for the curses loop, shown by the P overlay and optionally logged.
+# SOLITAIRE_FRAME_LOG=path appends one tab-separated row per frame. Whenever anything was collected, rolling p50/p99 values are written to frame-stats.json in the data directory on exit.
+# Times are milliseconds of work (input handling counts towards the frame it changes); time spent waiting for keys is not included.
+PHASES = ["drawTop", "drawTableau", "output", "input"]
+COUNTERS = ["addstr", "cards", "bytes", "cacheHits", "cacheBytes"] # cacheHits is 1 for a frame that came from Game.frameCache.
+METRICS = ["frame"] + PHASES + COUNTERS
+WINDOW = 1000 # Frames kept for the percentiles.
+
+def emptyFrame():
+    frame = dict.fromkeys(["frame"] + PHASES, 0.0)
+    frame.update(dict.fromkeys(COUNTERS, 0))
+    return frame
+
+def percentile(values, fraction: float):
+    if len(values) == 0:
+        return 0
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+class FrameStats:
+    def __init__(self, logPath: str = None, window: int = WINDOW):
+        self.overlay = False
+        self.frames = 0
+        self.current = emptyFrame()
+        self.last = dict(self.current)
+        self.history = {name: deque(maxlen=window) for name in METRICS}
+        self.log = None
+        if logPath:
+            self.log = open(logPath, "a", encoding="utf-8")
+            if self.log.tell() == 0:
+                self.log.write("\t".join(METRICS) + "\n")
+
+    @property
+    def active(self):
+        return self.overlay or self.log is not None
+
+    def add(self, name: str, amount):
+        self.current[name] += amount
+
+    def addTime(self, name: str, start: float):
+        # Adds the milliseconds since start (a time.perf_counter() value) to a phase.
+        self.current[name] += (time.perf_counter() - start) * 1000
+
+    def endFrame(self):
+        self.current["frame"] = sum(self.current[name] for name in PHASES)
+        for name in METRICS:
+            self.history[name].append(self.current[name])
+        if self.log is not None:
+            self.log.write("\t".join(f"{self.current[name]:.3f}" if isinstance(self.current[name], float) else str(self.current[name]) for name in METRICS) + "\n")
+        self.frames += 1
+        self.last = self.current
+        self.current = emptyFrame()
+
+    def summary(self):
+        return {name: {"p50": round(percentile(self.history[name], 0.5), 3), "p99": round(percentile(self.history[name], 0.99), 3)} for name in METRICS}
+
+    def cacheHitRate(self):
+        # Share of the frames in the window that were cached.
+        return sum(self.history["cacheHits"]) / len(self.history["cacheHits"]) if len(self.history["cacheHits"]) > 0 else 0
+
+    def overlayText(self):
+        # Last frame, then p50/p99 over the window.
+        last = self.last
+        summary = self.summary()
+        return (f"Frame {last['frame']:.2f}ms (p50 {summary['frame']['p50']:.2f}, p99 {summary['frame']['p99']:.2f}) | "
+            + " ".join(f"{name} {last[name]:.2f}" for name in PHASES)
+            + " | " + " ".join(f"{name} {last[name]}" for name in COUNTERS)
+            + f" | cache hit rate {self.cacheHitRate():.0%}")
+
+    def close(self):
+        if self.log is not None:
+            self.log.close()
+            self.log = None
+        if self.frames > 0:
+            try:
+                with open(os.path.join(dataDir(), "frame-stats.json"), "w", encoding="utf-8") as file:
+                    json.dump({"frames": self.frames, "window": len(self.history["frame"]), "unit": "ms", "cacheHitRate": round(self.cacheHitRate(), 3), "metrics": self.summary()}, file, indent=2)
+            except OSError:
+                pass
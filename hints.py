@@ -0,0 +1,144 @@
+from collections import OrderedDict
+import multiprocessing
+import queue
+from classes import Pile, getSymbolFromSuit, getSymbolFromValue
+from packed import PackedState
+from solver import Solver
+
+# ? Hints come from the solver running in a separate process, so a long search never holds up the curses loop (or fights it for the GIL).
+# Hints are cached by Game.stateHash, which tells column orders apart, since a hint's move names real columns.
+# Every request bumps a shared generation counter; the worker gives up on any search whose generation is out of date, which is how a changed game cancels it.
+
+def hintWorker(tasks, results, generation, maxNodes):
+    while True:
+        task = tasks.get()
+        if task is None:
+            return
+        taskGeneration, key, packed = task
+        if taskGeneration != generation.value:
+            continue
+        result = Solver(packed.toGame(), maxNodes, cancelled=lambda: generation.value != taskGeneration).solve()
+        results.put((taskGeneration, key, result.solvable, result.moves[0] if len(result.moves) > 0 else None))
+
+def describeCard(card):
+    return f"{getSymbolFromValue(card.value)}{getSymbolFromSuit(card.suit)}"
+
+def describeMove(game, move):
+    # None if the move doesn't fit the game as it is now.
+    if move.source == Pile.Stock:
+        return "draw from the deck"
+    if move.destination == Pile.Stock:
+        return "reset the waste"
+    if move.source == Pile.Tableau:
+        column = game.tableau[move.sourceIndex]
+        if not 0 < move.count <= len(column):
+            return None
+        card = column[len(column) - move.count]
+        source = f"column {move.sourceIndex + 1}"
+    elif move.source == Pile.Waste:
+        if len(game.waste) == 0:
+            return None
+        card = game.waste[-1]
+        source = "the waste"
+    else:
+        if len(game.foundation[move.sourceIndex].cards) == 0:
+            return None
+        card = game.foundation[move.sourceIndex].cards[-1]
+        source = f"foundation {move.sourceIndex + 1}"
+    destination = f"column {move.destinationIndex + 1}" if move.destination == Pile.Tableau else f"foundation {move.destinationIndex + 1}"
+    return f"move {describeCard(card)} from {source} to {destination}"
+
+class HintWorker:
+    def __init__(self, maxNodes: int = 200000, cacheSize: int = 256):
+        self.maxNodes = maxNodes
+        self.cacheSize = cacheSize
+        self.cache = OrderedDict() # State key -> (solvable, first move).
+        self.process = None
+        self.pendingKey = None
+        self.shownKey = None # State the status line hint belongs to.
+
+    def start(self):
+        # Started on the first hint, so games that never ask for one don't pay for the process.
+        self.generation = multiprocessing.Value("i", 0)
+        self.tasks = multiprocessing.Queue()
+        self.results = multiprocessing.Queue()
+        self.process = multiprocessing.Process(target=hintWorker, args=(self.tasks, self.results, self.generation, self.maxNodes), daemon=True)
+        self.process.start()
+
+    def request(self, game):
+        if game.winState: # Nothing left to hint at.
+            return
+        if len(game.grabbedCards) > 0:
+            game.putBackCard()
+        packed = PackedState.fromGame(game)
+        key = game.stateHash()
+        self.shownKey = key
+        if key in self.cache:
+            self.show(game, key)
+            return
+        if self.process is None:
+            self.start()
+        if key != self.pendingKey:
+            with self.generation.get_lock():
+                self.generation.value += 1
+            self.pendingKey = key
+            self.tasks.put((self.generation.value, key, packed))
+        game.statusMessage = "Hint: thinking..."
+
+    def show(self, game, key):
+        solvable, move = self.cache[key]
+        self.cache.move_to_end(key)
+        description = describeMove(game, move) if solvable and move is not None else None
+        if description is not None:
+            game.statusMessage = f"Hint: {description}. Winnable from here: yes."
+        elif solvable and move is None: # Already won, no move needed.
+            game.statusMessage = "Hint: nothing left to move. Winnable from here: yes."
+        elif solvable:
+            game.statusMessage = "Hint: Winnable from here: yes."
+        elif solvable is None:
+            game.statusMessage = "Hint: none found in time. Winnable from here: unknown."
+        else:
+            game.statusMessage = "Hint: no winning moves. Winnable from here: no."
+
+    def update(self, game):
+        # Called once per frame. Returns True when the status line changed.
+        if self.shownKey is None:
+            return False
+        if len(game.grabbedCards) > 0 or game.stateHash() != self.shownKey:
+            # The game moved on; drop the hint and stop searching for it.
+            self.shownKey = None
+            game.statusMessage = None
+            if self.pendingKey is not None:
+                with self.generation.get_lock():
+                    self.generation.value += 1
+                self.pendingKey = None
+            return True
+        changed = False
+        while self.process is not None:
+            try:
+                taskGeneration, key, solvable, move = self.results.get_nowait()
+            except queue.Empty:
+                break
+            self.cache[key] = (solvable, move)
+            if len(self.cache) > self.cacheSize:
+                self.cache.popitem(last=False)
+            if key == self.pendingKey:
+                self.pendingKey = None
+            if key == self.shownKey:
+                self.show(game, key)
+                changed = True
+        return changed
+
+    @property
+    def waiting(self):
+        return self.pendingKey is not None
+
+    def close(self):
+        if self.process is not None:
+            with self.generation.get_lock():
+                self.generation.value += 1
+            self.tasks.put(None)
+            self.process.join(0.5)
+            if self.process.is_alive():
+                self.process.terminate()
+            self.process = None
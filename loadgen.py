@@ -0,0 +1,97 @@
+import argparse
+import asyncio
+import json
+import random
+import resource
+import sys
+import time
+from framestats import percentile
+from server import raiseFileLimit
+
+# ? Load generator for server.py: many clients at once, each pressing random keys and timing the frame that comes back for every one.
+# Usage: python loadgen.py --unix /tmp/solitaire.sock --sessions 1000 --duration 30
+# Keys are the ones a player presses all the time; q, y and n are left out so sessions stay open for the whole run.
+KEYS = [258, 259, 260, 261] + [ord(key) for key in "drcvfuU12345t"]
+
+class LoadStats:
+    def __init__(self):
+        self.latencies = []
+        self.keys = 0
+        self.connected = 0
+        self.closed = 0
+        self.errors = 0
+        self.bytes = 0
+
+async def connect(args):
+    if args.unix:
+        return await asyncio.open_unix_connection(args.unix, limit=1 << 20)
+    return await asyncio.open_connection("127.0.0.1", args.port, limit=1 << 20)
+
+async def client(args, stats: LoadStats, rng: random.Random, deadline: float):
+    try:
+        reader, writer = await connect(args)
+    except OSError:
+        stats.errors += 1
+        return
+    try:
+        writer.write((json.dumps({"session": None, "draw": args.draw, "width": 160, "height": 60}) + "\n").encode("utf-8"))
+        line = await reader.readline()
+        if not line or "error" in json.loads(line):
+            stats.errors += 1
+            return
+        stats.connected += 1
+        await asyncio.sleep(rng.uniform(0, args.interval)) # Spread the clients out.
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            writer.write((json.dumps({"key": rng.choice(KEYS)}) + "\n").encode("utf-8"))
+            line = await reader.readline()
+            if not line:
+                stats.errors += 1
+                return
+            stats.latencies.append((time.perf_counter() - start) * 1000)
+            stats.keys += 1
+            stats.bytes += len(line)
+            if "closed" in json.loads(line): # Won by chance.
+                stats.closed += 1
+                return
+            await asyncio.sleep(args.interval * rng.uniform(0.5, 1.5))
+    except (OSError, ValueError):
+        stats.errors += 1
+    finally:
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except OSError:
+            pass
+
+async def run(args):
+    stats = LoadStats()
+    rng = random.Random(args.seed)
+    start = time.monotonic()
+    deadline = start + args.duration
+    await asyncio.gather(*(client(args, stats, random.Random(rng.random()), deadline) for i in range(args.sessions)))
+    return stats, time.monotonic() - start
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Drive server.py with many simulated players and report keystroke latency.")
+    parser.add_argument("--unix", default=None, help="Unix socket path the server listens on.")
+    parser.add_argument("--port", type=int, default=8765, help="Localhost TCP port, when not using --unix.")
+    parser.add_argument("--sessions", type=int, default=1000, help="Simultaneous clients. Default 1000.")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds to keep pressing keys.")
+    parser.add_argument("--interval", type=float, default=0.2, help="Average seconds between one client's keys.")
+    parser.add_argument("--draw", type=int, choices=[1, 3], default=1, help="Draw 1 or draw 3 games.")
+    parser.add_argument("--seed", type=int, default=None, help="Seed for the key choices.")
+    args = parser.parse_args(argv)
+    raiseFileLimit()
+
+    stats, elapsed = asyncio.run(run(args))
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    print(f"{stats.connected}/{args.sessions} sessions connected, {stats.closed} won, {stats.errors} errors.")
+    print(f"{stats.keys} keys in {elapsed:.1f}s ({stats.keys / elapsed:.0f} keys/s), {stats.bytes / max(stats.keys, 1):.0f} bytes per frame.")
+    print(f"Latency p50 {percentile(stats.latencies, 0.5):.2f}ms, p99 {percentile(stats.latencies, 0.99):.2f}ms, max {max(stats.latencies, default=0):.2f}ms. Load generator CPU {usage.ru_utime + usage.ru_stime:.1f}s.")
+    if stats.errors > 0:
+        sys.exit(1)
+
+# Init.
+if __name__ == "__main__":
+    main()
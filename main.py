@@ -1,5 +1,16 @@
 import curses
-from classes import Game
+import datetime
+import os
+import sys
+import time
+from palette import colorPair
+from paths import dataDir
+from render import FrameBuffer, WRITE
+
+# ? Only what the intro needs is imported up front. The game modules (and the multiprocessing, solver and Enum setup behind them) load in the functions that use them, once a mode is picked.
+# startup.json in the data directory gets the milliseconds from here to curses being ready and the intro being on screen, how long the process had been running by then (Linux, to 10 ms), and the CPU time used.
+LAUNCHED = time.perf_counter()
+STARTUP_LIMIT_MS = 50
 
 INTRO = """Welcome to Solitaire!
 This is a port of Solitaire, more specifically Klondike, to the terminal.
@@ -8,79 +19,298 @@ The following options are available:
     1) Start a new game, using turn 1.
     2) Start a new game, using turn 3.
     3) Quit the game.
+    4) Start a winnable deal, using turn 1.
+    5) Start a winnable deal, using turn 3.
+    6) Resume the game saved when you last quit.
+    7) Show win rate, streaks and best times.
 
 To avoid inconsistency with the module curses, please play the game with the terminal in fullscreen mode.
 Requires 256-color (xterm-256) support. Support is indicated if the heart is visible and is pink: """
 
-# ? Main game loop. Handles all actions involving curses. Ideally, this should be the only thing that uses curses. Do not pass stdscr to any other functions.
+# ? Frames are capped to this rate; keys arriving faster are applied together before the next frame.
+MAX_FPS = float(os.environ.get("SOLITAIRE_MAX_FPS", 60))
+FRAME_TIME = 1 / MAX_FPS if MAX_FPS > 0 else 0
+# Milliseconds between cards when auto-completing, 0 to jump straight to the end.
+AUTO_COMPLETE_DELAY = int(os.environ.get("SOLITAIRE_AUTO_COMPLETE_DELAY", 0))
+
+# Applies only what changed since the last frame, then flushes the terminal once. Returns the number of addstr calls.
+def drawFrame(stdscr, frameBuffer, gameString):
+    height, width = stdscr.getmaxyx()
+    writes = 0
+    for operation in frameBuffer.update(gameString, width, height):
+        try:
+            if operation[0] == WRITE:
+                writes += 1
+                stdscr.addstr(operation[1], operation[2], operation[3], colorPair(operation[4]))
+            else:
+                stdscr.move(operation[1], operation[2])
+                stdscr.clrtoeol()
+        except curses.error: # Writing the bottom-right cell moves the cursor off screen, the text still gets drawn.
+            pass
+    stdscr.noutrefresh()
+    curses.doupdate()
+    return writes
+
+# Draws a game frame, with the P overlay and timings when stats are being collected.
+def drawGameFrame(stdscr, frameBuffer, game, stats):
+    if not stats.active:
+        game.profiler = None
+        drawFrame(stdscr, frameBuffer, game.drawGame())
+        return
+    game.profiler = stats
+    gameString = game.drawGame()
+    if stats.overlay:
+        gameString += "\n" + stats.overlayText()
+    stats.add("bytes", len(gameString.encode("utf-8")))
+    start = time.perf_counter()
+    stats.add("addstr", drawFrame(stdscr, frameBuffer, gameString))
+    stats.addTime("output", start)
+    stats.endFrame()
+
+# Starts a game, recorded to the recordings directory unless SOLITAIRE_RECORD=0.
+def startGame(turnthree, previous = None, seed = None):
+    from classes import Game
+    from recording import GameRecorder
+    stopRecording(previous)
+    game = Game(turnthree, seed)
+    if os.environ.get("SOLITAIRE_RECORD", "1") != "0":
+        try:
+            GameRecorder(game, os.path.join(dataDir("recordings"), f"{datetime.datetime.now():%Y%m%d-%H%M%S}-{game.seed}.sol"))
+        except OSError: # Recording is optional, never stop the game over it.
+            pass
+    return game
+
+# Keeps an unfinished game for option 6 when quitting. A won game has nothing left to resume.
+def saveOnQuit(game):
+    from savegame import removeSave, saveGame
+    try:
+        if game.winState:
+            removeSave()
+        else:
+            game.putBackCard()
+            saveGame(game)
+    except (OSError, ValueError): # Saving is optional too.
+        pass
+
+# The saved game, or None (with the reason on screen) if there isn't a usable one. Resumed games aren't recorded, recordings start from the deal.
+def resumeGame(stdscr):
+    from savegame import loadGame
+    try:
+        game = loadGame()
+    except (OSError, ValueError) as error:
+        stdscr.addstr(f"\nThe saved game can't be loaded: {error}\n")
+        return None
+    if game is None:
+        stdscr.addstr("\nThere is no saved game.\n")
+    return game
+
+def stopRecording(game):
+    if game is not None and game.recorder is not None:
+        game.recorder.close()
+        game.recorder = None
+
+# Returns a function picking winnable seeds from the deal index, or None (with the reason on screen) if there's nothing to pick from.
+def chooseWinnableDeals(stdscr, turnthree):
+    from dealindex import DealIndex, DIFFICULTIES
+    try:
+        index = DealIndex()
+    except (OSError, ValueError):
+        stdscr.addstr("\nNo winnable deal index found. Build one with analyze.py and dealindex.py build.\n")
+        return None
+    stdscr.addstr("\nDifficulty? E) Easy, M) Medium, H) Hard, any other key for any: ")
+    key = stdscr.getch()
+    difficulty = {ord('e'): 0, ord('m'): 1, ord('h'): 2}.get(key)
+    if index.winnableCount(turnthree, difficulty) == 0:
+        stdscr.addstr(f"\nThe index has no {DIFFICULTIES[difficulty] + ' ' if difficulty is not None else ''}winnable draw {3 if turnthree else 1} deals.\n")
+        return None
+    return lambda: index.randomWinnable(turnthree, difficulty)
+
+# Applies a single key press to the game. Returns the game to keep playing (a new one after Y), or None to quit.
+def handleKey(game, c, newGame, hints, onCard = None):
+    if c == ord('d'):
+        game.drawNewWaste()
+    elif c == ord('r'):
+        game.resetWaste()
+    elif c == ord('q'):
+        return None
+    elif c == 27: # Escape
+        game.putBackCard()
+    elif c == 259: # Up Arrow
+        game.cursorMoveUp()
+    elif c == 258: # Down Arrow
+        game.cursorMoveDown()
+    elif c == 260: # Left Arrow
+        game.cursorMoveLeft()
+    elif c == 261: # Right Arrow
+        game.cursorMoveRight()
+    elif c == ord('1'):
+        game.cursorpos = 9 # Foundation 1
+    elif c == ord('2'):
+        game.cursorpos = 10 # Foundation 2
+    elif c == ord('3'):
+        game.cursorpos = 11 # Foundation 3
+    elif c == ord('4'):
+        game.cursorpos = 12 # Foundation 4
+    elif c == ord('5'):
+        game.cursorpos = 8 # Waste
+    elif c == ord('c'):
+        game.grabSelectedCard()
+    elif c == ord('v'):
+        game.placeGrabbedCard()
+    elif c == ord('f'):
+        game.autoMoveToFoundation()
+    elif c == ord('u'):
+        game.undo()
+    elif c == ord('U'):
+        game.redo()
+    elif c == ord('a'):
+        game.autoComplete(onCard)
+    elif c == ord('h'):
+        hints.request(game)
+    elif c == ord('t'):
+        game.printTimeOnNextDraw()
+    elif c == ord('n'):
+        game.newGame()
+    elif c == ord ('y'):
+        if game.newGameState:
+            game = newGame(game)
+    game.revealTops()
+    return game
+
+# Waits for a key (up to pollMs, -1 to block), then keeps collecting keys until the next frame is due and drains anything already queued, so held keys don't pile up redraws.
+def readKeys(stdscr, deadline, pollMs = -1):
+    stdscr.timeout(pollMs)
+    c = stdscr.getch()
+    if c == -1:
+        return []
+    keys = [c]
+    while True:
+        stdscr.timeout(max(int((deadline - time.perf_counter()) * 1000), 0))
+        c = stdscr.getch()
+        if c == -1:
+            break
+        keys.append(c)
+    stdscr.timeout(-1)
+    return keys
+
+# Milliseconds since the process started, interpreter startup included, or None where /proc can't tell.
+def processAge():
+    try:
+        with open("/proc/self/stat", encoding="ascii") as file:
+            fields = file.read().rsplit(")", 1)[1].split()
+        return (time.clock_gettime(time.CLOCK_BOOTTIME) - int(fields[19]) / os.sysconf("SC_CLK_TCK")) * 1000
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+def writeStartupReport(cursesReady, introShown, age):
+    import json # Not needed before the intro, and it brings in re and enum.
+    steps = {"curses": round((cursesReady - LAUNCHED) * 1000, 1), "intro": round((introShown - LAUNCHED) * 1000, 1)}
+    report = {"unit": "ms", "steps": steps, "process": round(age) if age is not None else None, "cpu": round(time.process_time() * 1000, 1), "limit": STARTUP_LIMIT_MS}
+    report["withinLimit"] = (age if age is not None else steps["intro"]) <= STARTUP_LIMIT_MS
+    try:
+        with open(os.path.join(dataDir(), "startup.json"), "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+    except OSError:
+        pass
+
+# Plays a recording back at its original pace (or faster with speed > 1). Q stops it.
+def playback(stdscr, path, speed = 1.0):
+    from classes import Game
+    from recording import Recording, applyEvent
+    recording = Recording(path)
+    game = Game(recording.turnthree, recording.seed)
+    frameBuffer = FrameBuffer()
+    stdscr.clear()
+    drawFrame(stdscr, frameBuffer, game.drawGame())
+    lastMs = 0
+    for elapsedMs, kind, move in recording.events():
+        stdscr.timeout(min(int((elapsedMs - lastMs) / speed), 2000))
+        if stdscr.getch() == ord('q'):
+            return
+        applyEvent(game, kind, move)
+        game.revealTops()
+        drawFrame(stdscr, frameBuffer, game.drawGame())
+        lastMs = elapsedMs
+    stdscr.timeout(-1)
+    stdscr.getch()
+
+# ? Main game loop. Handles all actions involving curses. Ideally, this should be the only thing that uses curses. Do not pass stdscr to any functions outside this file.
 def main(stdscr):
+    cursesReady = time.perf_counter()
     stdscr.clear()
     stdscr.addstr(INTRO)
-    stdscr.addstr("♥\n", curses.color_pair(202))
-    curses.start_color()
-    curses.use_default_colors()
-    for i in range(0, curses.COLORS - 1):
-        curses.init_pair(i + 1, i, -1)
+    stdscr.addstr("♥\n", colorPair(202))
+    stdscr.refresh()
+    writeStartupReport(cursesReady, time.perf_counter(), processAge())
 
     while True:
         mainChoice = stdscr.getch()
-        if mainChoice == ord('1') or mainChoice == ord('2'): # The actual game loop begins here.
-            game = Game(mainChoice == ord('2'))
+        if mainChoice in (ord('1'), ord('2'), ord('4'), ord('5'), ord('6')): # The actual game loop begins here.
+            turnthree = mainChoice in (ord('2'), ord('5'))
+            pickSeed = lambda: None
+            if mainChoice in (ord('4'), ord('5')):
+                pickSeed = chooseWinnableDeals(stdscr, turnthree)
+                if pickSeed is None:
+                    continue
+            if mainChoice == ord('6'):
+                game = resumeGame(stdscr)
+                if game is None:
+                    continue
+                turnthree = game.turnthree
+            newGame = lambda previous = None: startGame(turnthree, previous, pickSeed())
+            if mainChoice != ord('6'):
+                game = newGame()
+            from framestats import FrameStats
+            from hints import HintWorker
+            from statslog import ABANDONED, WON, StatsLog
+            hints = HintWorker()
+            frameBuffer = FrameBuffer()
+            stats = FrameStats(os.environ.get("SOLITAIRE_FRAME_LOG"))
+            results = StatsLog()
+            logged = None # The game whose result is already in the stats log; each game is logged once, even if a win is undone.
+            stdscr.clear()
+            def animate():
+                drawGameFrame(stdscr, frameBuffer, game, stats)
+                curses.napms(AUTO_COMPLETE_DELAY)
             while True:
-                stdscr.clear()
-                gameString = game.drawGame()
-                for char in gameString:
-                    if char == "♥":
-                        stdscr.addstr("♥", curses.color_pair(197))
-                    elif char == "♦":
-                        stdscr.addstr("♦", curses.color_pair(197))
-                    elif char == "/":
-                        stdscr.addstr("/", curses.color_pair(240))
-                    else:
-                        stdscr.addstr(char)
-                c = stdscr.getch()
-                if c == ord('d'):
-                    game.drawNewWaste()
-                elif c == ord('r'):
-                    game.resetWaste()
-                elif c == ord('q'):
-                    return
-                elif c == 27: # Escape
-                    game.putBackCard()
-                elif c == 259: # Up Arrow
-                    game.cursorMoveUp()
-                elif c == 258: # Down Arrow
-                    game.cursorMoveDown()
-                elif c == 260: # Left Arrow
-                    game.cursorMoveLeft()
-                elif c == 261: # Right Arrow
-                    game.cursorMoveRight()
-                elif c == ord('1'):
-                    game.cursorpos = 9 # Foundation 1
-                elif c == ord('2'):
-                    game.cursorpos = 10 # Foundation 2
-                elif c == ord('3'):
-                    game.cursorpos = 11 # Foundation 3
-                elif c == ord('4'):
-                    game.cursorpos = 12 # Foundation 4
-                elif c == ord('5'):
-                    game.cursorpos = 8 # Waste
-                elif c == ord('c'):
-                    game.grabSelectedCard()
-                elif c == ord('v'):
-                    game.placeGrabbedCard()
-                elif c == ord('f'):
-                    game.autoMoveToFoundation()
-                elif c == ord('t'):
-                    game.printTimeOnNextDraw()
-                elif c == ord('n'):
-                    game.newGame()
-                elif c == ord ('y'):
-                    if game.newGameState:
-                        game = Game(mainChoice == ord('2'))
+                hints.update(game)
+                drawGameFrame(stdscr, frameBuffer, game, stats)
+                lastFrame = time.perf_counter()
+                # While a hint is being worked out, wake up now and then to show it when it arrives.
+                for c in readKeys(stdscr, lastFrame + FRAME_TIME, 100 if hints.waiting else -1):
+                    start = time.perf_counter()
+                    if c == curses.KEY_RESIZE:
+                        stdscr.clear()
+                        frameBuffer.invalidate()
+                        continue
+                    if c == ord('p'): # Frame stats overlay.
+                        stats.overlay = not stats.overlay
+                        continue
+                    nextGame = handleKey(game, c, newGame, hints, animate if AUTO_COMPLETE_DELAY > 0 else None)
+                    if nextGame is None:
+                        saveOnQuit(game)
+                        stopRecording(game)
+                        hints.close()
+                        stats.close()
+                        results.close()
+                        return
+                    if nextGame is not game and logged is not game:
+                        results.record(game, ABANDONED)
+                    game = nextGame
+                    if game.winState and logged is not game:
+                        results.record(game, WON)
+                        logged = game
+                    if stats.active: # Otherwise no frame ends to take it.
+                        stats.addTime("input", start)
+        elif mainChoice == ord('7'):
+            from statslog import StatsIndex, summaryText
+            stdscr.addstr("\n" + summaryText(StatsIndex()) + "\n")
         elif mainChoice == ord('3') or mainChoice == ord('q'):
             break
 
 # Init.
 if __name__ == "__main__":
-    curses.wrapper(main)
+    if len(sys.argv) > 2 and sys.argv[1] == "--replay":
+        curses.wrapper(playback, sys.argv[2], float(sys.argv[3]) if len(sys.argv) > 3 else 1.0)
+    else:
+        curses.wrapper(main)
@@ -0,0 +1,118 @@
+from classes import RANK, SUIT, Card, Suit, Value, Foundation, Game
+
+# ? Packed cards are ints 0-51: suit index * 13 + rank - 1, suit index following the Suit enum order (Spades, Hearts, Clubs, Diamonds).
+SUITS = list(Suit)
+VALUES = list(Value)
+NO_SUIT = 255
+NO_POS = 0
+
+def cardId(card: Card):
+    return card.index
+
+def cardFromId(card: int, hidden: bool = False):
+    return Card(SUITS[SUIT[card]], VALUES[RANK[card] - 1], hidden)
+
+# ? Alternate state model for bulk work (solving, simulation). Every pile is a bytearray of card ids and the foundations are just rank counters, so copying a state is a handful of buffer copies instead of 52 Card objects.
+class PackedState:
+    __slots__ = ("tableau", "hidden", "foundationSuits", "foundationRanks", "stock", "waste", "visible", "wasteHidden", "grabbed", "grabbedPos", "turnthree", "seed", "moves", "cursorpos", "verticalmovementpos")
+
+    def __init__(self):
+        self.tableau = [bytearray() for i in range(7)] # Bottom to top.
+        self.hidden = bytearray(7) # Face-down cards at the bottom of each column.
+        self.foundationSuits = bytearray([NO_SUIT] * 4) # Suit index per foundation slot.
+        self.foundationRanks = bytearray(4) # Highest rank per foundation slot, 0 when empty.
+        self.stock = bytearray() # Deck.cards order, next card to draw is last.
+        self.waste = bytearray() # Deck.removed_cards order.
+        self.visible = 0 # len(Game.waste), the end of the waste that is on display.
+        self.wasteHidden = bytearray() # Card.wasteHidden for each card on display.
+        self.grabbed = bytearray()
+        self.grabbedPos = NO_POS
+        self.turnthree = False
+        self.seed = None # The deal this state came from.
+        self.moves = 0
+        self.cursorpos = 1
+        self.verticalmovementpos = 0
+
+    @classmethod
+    def fromGame(cls, game: Game):
+        state = cls()
+        for i, column in enumerate(game.tableau):
+            state.tableau[i] = bytearray(cardId(card) for card in column)
+            count = 0
+            for card in column:
+                if not card.hidden:
+                    break
+                count += 1
+            state.hidden[i] = count
+        for i, pile in enumerate(game.foundation):
+            if len(pile.cards) > 0:
+                state.foundationSuits[i] = pile.cards[-1].suit.value - 1
+                state.foundationRanks[i] = pile.cards[-1].value.value
+        state.stock = bytearray(cardId(card) for card in game.deck.cards)
+        state.waste = bytearray(cardId(card) for card in game.deck.removed_cards)
+        state.visible = len(game.waste)
+        state.wasteHidden = bytearray(card.wasteHidden for card in game.waste)
+        state.grabbed = bytearray(cardId(card) for card in game.grabbedCards)
+        state.grabbedPos = game.grabbedCardPos or NO_POS
+        state.turnthree = game.turnthree
+        state.seed = game.seed
+        state.moves = game.moves
+        state.cursorpos = game.cursorpos
+        state.verticalmovementpos = game.verticalmovementpos
+        return state
+
+    def toGame(self):
+        game = Game(self.turnthree, self.seed, False)
+        game.tableau = []
+        for i in range(7):
+            game.tableau.append([cardFromId(card, j < self.hidden[i]) for j, card in enumerate(self.tableau[i])])
+        game.hiddenCount = sum(self.hidden)
+        game.foundation = []
+        for i in range(4):
+            pile = Foundation()
+            if self.foundationRanks[i] > 0:
+                pile.suit = SUITS[self.foundationSuits[i]]
+                pile.cards = [cardFromId(self.foundationSuits[i] * 13 + rank, False) for rank in range(self.foundationRanks[i])]
+            game.foundation.append(pile)
+        game.deck.restore([cardFromId(card, True) for card in self.stock], [cardFromId(card, False) for card in self.waste])
+        game.waste = game.deck.wasteTop(self.visible)
+        for i, card in enumerate(game.waste):
+            card.wasteHidden = bool(self.wasteHidden[i])
+        game.positionHash = game.hashPosition()
+        game.grabbedCards = [cardFromId(card, False) for card in self.grabbed]
+        game.grabbedCardPos = self.grabbedPos or None
+        game.moves = self.moves
+        game.cursorpos = self.cursorpos
+        game.verticalmovementpos = self.verticalmovementpos
+        return game
+
+    def copy(self):
+        state = PackedState()
+        state.tableau = [bytearray(column) for column in self.tableau]
+        state.hidden = bytearray(self.hidden)
+        state.foundationSuits = bytearray(self.foundationSuits)
+        state.foundationRanks = bytearray(self.foundationRanks)
+        state.stock = bytearray(self.stock)
+        state.waste = bytearray(self.waste)
+        state.visible = self.visible
+        state.wasteHidden = bytearray(self.wasteHidden)
+        state.grabbed = bytearray(self.grabbed)
+        state.grabbedPos = self.grabbedPos
+        state.turnthree = self.turnthree
+        state.seed = self.seed
+        state.moves = self.moves
+        state.cursorpos = self.cursorpos
+        state.verticalmovementpos = self.verticalmovementpos
+        return state
+
+    def foundationBySuit(self):
+        output = [0, 0, 0, 0]
+        for i in range(4):
+            if self.foundationRanks[i] > 0:
+                output[self.foundationSuits[i]] = self.foundationRanks[i]
+        return output
+
+    def __eq__(self, other):
+        if not isinstance(other, PackedState):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in PackedState.__slots__)
@@ -0,0 +1,24 @@
+import curses
+
+# ? Color pairs, each set up the first time it's drawn with instead of all of them at startup. Pair n shows terminal color n - 1 on the default background,
+# so the numbers in render.COLOR_PAIRS (and the intro's 202) name colors of the 256-color palette. Pairs the terminal doesn't have fall back to the default colors.
+PAIRS = {0: 0} # Pair number -> curses attribute.
+STARTED = False
+
+def startColors():
+    global STARTED
+    STARTED = True
+    curses.start_color()
+    curses.use_default_colors()
+
+def colorPair(number: int):
+    attribute = PAIRS.get(number)
+    if attribute is None:
+        if not STARTED:
+            startColors()
+        attribute = 0
+        if number < curses.COLOR_PAIRS and number - 1 < curses.COLORS:
+            curses.init_pair(number, number - 1, -1)
+            attribute = curses.color_pair(number)
+        PAIRS[number] = attribute
+    return attribute
@@ -0,0 +1,7 @@
+import os
+
+# ? Everything the game writes (recordings, saves, stats) lives under one directory. SOLITAIRE_HOME overrides it.
+def dataDir(*parts):
+    path = os.path.join(os.environ.get("SOLITAIRE_HOME", os.path.join(os.path.expanduser("~"), ".solitaire")), *parts)
+    os.makedirs(path, exist_ok=True)
+    return path
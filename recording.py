@@ -0,0 +1,143 @@
+import datetime
+import os
+import struct
+import time
+from classes import RANK, Game, Move, Pile, decodeMove, encodeMove
+
+# ? Binary session recordings. A header (magic, version, flags, deal seed, start time) followed by one record per event:
+# a varint of (milliseconds since the previous event << 2 | event type), then for moves a 16-bit move code (classes.encodeMove).
+# Files are append-only and a truncated last record (crash mid-write) is ignored on reading.
+MAGIC = b"SOLR"
+VERSION = 1
+HEADER = struct.Struct("<4sBBQd")
+MOVE_CODE = struct.Struct("<H")
+MOVE = 0
+UNDO = 1
+REDO = 2
+
+FLAG_TURNTHREE = 1
+
+def encodeVarint(value: int, output: bytearray):
+    while value >= 0x80:
+        output.append(value & 0x7F | 0x80)
+        value >>= 7
+    output.append(value)
+
+class GameRecorder:
+    def __init__(self, game: Game, path: str, bufferSize: int = 65536):
+        # A large write buffer, so recording a move is just appending a few bytes in memory.
+        # Never added to an existing file, which would no longer replay: a second game of the same deal in the same second gets path-2.sol, and so on.
+        base, extension = os.path.splitext(path)
+        self.path = path
+        suffix = 1
+        while True:
+            try:
+                self.file = open(self.path, "xb", buffering=bufferSize)
+                break
+            except FileExistsError:
+                suffix += 1
+                self.path = f"{base}-{suffix}{extension}"
+        self.start = time.monotonic()
+        self.lastMs = 0
+        self.file.write(HEADER.pack(MAGIC, VERSION, FLAG_TURNTHREE if game.turnthree else 0, game.seed, time.time()))
+        game.recorder = self
+
+    def event(self, kind: int, move: Move = None):
+        elapsedMs = int((time.monotonic() - self.start) * 1000)
+        record = bytearray()
+        encodeVarint((elapsedMs - self.lastMs) << 2 | kind, record)
+        self.lastMs = elapsedMs
+        if move is not None:
+            record += MOVE_CODE.pack(encodeMove(move))
+        self.file.write(record)
+
+    def move(self, move: Move):
+        self.event(MOVE, move)
+
+    def undo(self):
+        self.event(UNDO)
+
+    def redo(self):
+        self.event(REDO)
+
+    def close(self):
+        self.file.close()
+
+class Recording:
+    def __init__(self, path: str):
+        with open(path, "rb") as file:
+            data = file.read()
+        if len(data) < HEADER.size:
+            raise ValueError(f"{path} is not a solitaire recording")
+        magic, version, flags, self.seed, startTime = HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} solitaire recording")
+        self.path = path
+        self.turnthree = bool(flags & FLAG_TURNTHREE)
+        self.startTime = datetime.datetime.fromtimestamp(startTime)
+        self.data = data
+
+    def events(self):
+        # Yields (milliseconds since start, event type, move or None).
+        data = self.data
+        offset = HEADER.size
+        elapsedMs = 0
+        while offset < len(data):
+            value = 0
+            shift = 0
+            while offset < len(data):
+                byte = data[offset]
+                offset += 1
+                value |= (byte & 0x7F) << shift
+                shift += 7
+                if byte < 0x80:
+                    break
+            else:
+                return
+            elapsedMs += value >> 2
+            kind = value & 3
+            move = None
+            if kind == MOVE:
+                if offset + MOVE_CODE.size > len(data):
+                    return
+                move = decodeMove(MOVE_CODE.unpack_from(data, offset)[0])
+                offset += MOVE_CODE.size
+            yield elapsedMs, kind, move
+
+def isLegalMove(game: Game, move: Move):
+    if move in game.legalMoves():
+        return True
+    # legalMoves only lists the first empty foundation for an Ace, but a player can put one on any empty foundation, or move it between them.
+    if move.destination != Pile.Foundation or move.count != 1 or move.destinationIndex > 3 or len(game.foundation[move.destinationIndex].cards) > 0:
+        return False
+    if move.source == Pile.Tableau and move.sourceIndex < 7 and len(game.tableau[move.sourceIndex]) > 0:
+        card = game.tableau[move.sourceIndex][-1]
+    elif move.source == Pile.Waste and len(game.waste) > 0:
+        card = game.waste[-1]
+    elif move.source == Pile.Foundation and move.sourceIndex < 4 and len(game.foundation[move.sourceIndex].cards) > 0:
+        card = game.foundation[move.sourceIndex].cards[-1]
+    else:
+        return False
+    return not card.hidden and RANK[card.index] == 1
+
+def applyEvent(game: Game, kind: int, move: Move):
+    # Raises ValueError on a move that doesn't fit the game, so a damaged or diverging recording stops there instead of corrupting the piles.
+    if kind == MOVE:
+        if not isLegalMove(game, move):
+            raise ValueError(f"{move.source.name} {move.sourceIndex} to {move.destination.name} {move.destinationIndex} ({move.count} cards) doesn't apply after {game.moves} moves")
+        game.applyMove(move)
+    elif kind == UNDO:
+        game.undo()
+    elif kind == REDO:
+        game.redo()
+
+def replayRecording(path: str, callback = None):
+    # Rebuilds the game headlessly and returns it in its final state. callback(game, elapsedMs) runs after every event.
+    recording = Recording(path)
+    game = Game(recording.turnthree, recording.seed)
+    game.revealTops()
+    for elapsedMs, kind, move in recording.events():
+        applyEvent(game, kind, move)
+        if callback is not None:
+            callback(game, elapsedMs)
+    return game
@@ -0,0 +1,75 @@
+# ? Frame diffing for the curses loop. Nothing in here touches curses; main.py turns the operations into addstr/clrtoeol calls.
+
+TAB_SIZE = 8 # Same as curses' default TABSIZE.
+
+# Characters drawn with a color pair, everything else uses pair 0 (default colors).
+COLOR_PAIRS = {
+    "♥": 197,
+    "♦": 197,
+    "/": 240,
+}
+
+WRITE = 0
+CLEAR = 1
+
+def frameLines(frame: str, width: int):
+    # Expand tabs and wrap at the screen width, the same way addstr would lay the frame out.
+    output = []
+    for line in frame.split("\n"):
+        line = line.expandtabs(TAB_SIZE)
+        if width <= 0 or len(line) <= width:
+            output.append(line)
+        else:
+            for i in range(0, len(line), width):
+                output.append(line[i:i + width])
+    return output
+
+def colorRuns(text: str, x: int):
+    # Splits text into runs that share a color pair: [(x, text, pair), ...]
+    output = []
+    start = 0
+    pair = COLOR_PAIRS.get(text[0], 0) if len(text) > 0 else 0
+    for i in range(1, len(text)):
+        charPair = COLOR_PAIRS.get(text[i], 0)
+        if charPair != pair:
+            output.append((x + start, text[start:i], pair))
+            start = i
+            pair = charPair
+    if start < len(text):
+        output.append((x + start, text[start:], pair))
+    return output
+
+class FrameBuffer:
+    def __init__(self):
+        self.lines = []
+
+    def invalidate(self):
+        # Forget the last frame so the next one is drawn in full (first frame, resize, after another screen).
+        self.lines = []
+
+    def update(self, frame: str, width: int, height: int):
+        # Returns the operations needed to turn the last frame into this one:
+        # (WRITE, y, x, text, pair) and (CLEAR, y, x) meaning clear to the end of the line.
+        lines = frameLines(frame, width)[:height]
+        operations = []
+        for y in range(max(len(lines), len(self.lines))):
+            new = lines[y] if y < len(lines) else ""
+            old = self.lines[y] if y < len(self.lines) else ""
+            if new == old:
+                continue
+            start = 0
+            shortest = min(len(new), len(old))
+            while start < shortest and new[start] == old[start]:
+                start += 1
+            if len(new) == len(old):
+                end = len(new)
+                while end > start and new[end - 1] == old[end - 1]:
+                    end -= 1
+            else:
+                end = len(new)
+            for x, text, pair in colorRuns(new[start:end], start):
+                operations.append((WRITE, y, x, text, pair))
+            if len(new) < len(old):
+                operations.append((CLEAR, y, len(new)))
+        self.lines = lines
+        return operations
@@ -0,0 +1,55 @@
+import argparse
+import sys
+import time
+from recording import replayRecording
+
+# ? Headless replay of session recordings, for bulk verification and statistics.
+# Usage: python replay.py ~/.solitaire/recordings/*.sol
+# Paced playback in the terminal is in main.py: python main.py --replay FILE
+
+def replayFile(path: str):
+    events = 0
+    durationMs = 0
+    def count(game, elapsedMs):
+        nonlocal events, durationMs
+        events += 1
+        durationMs = elapsedMs
+    game = replayRecording(path, count)
+    return {
+        "path": path,
+        "seed": game.seed,
+        "draw": 3 if game.turnthree else 1,
+        "events": events,
+        "moves": game.moves,
+        "won": game.winState,
+        "seconds": durationMs / 1000,
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay solitaire recordings headlessly and report on them.")
+    parser.add_argument("files", nargs="+", help="Recording files.")
+    parser.add_argument("--quiet", action="store_true", help="Only print the totals.")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    totalEvents = 0
+    wins = 0
+    failed = 0
+    for path in args.files:
+        try:
+            result = replayFile(path)
+        except (OSError, ValueError) as error:
+            failed += 1
+            print(f"{path}: {error}", file=sys.stderr)
+            continue
+        totalEvents += result["events"]
+        wins += result["won"]
+        if not args.quiet:
+            print(f"{path}: deal {result['seed']}, draw {result['draw']}, {result['moves']} moves, {'won' if result['won'] else 'not won'}, {result['seconds']:.0f}s played")
+    elapsed = time.perf_counter() - start
+    replayed = len(args.files) - failed
+    print(f"{replayed} recordings, {wins} won, {failed} unreadable or not replayable. {totalEvents} events replayed at {totalEvents / elapsed if elapsed > 0 else 0:.0f} events/s.")
+
+# Init.
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+import datetime
+import os
+import struct
+from packed import PackedState
+from paths import dataDir
+
+# ? Saved games: one game in a compact versioned byte format, written when quitting and read back in a single small read on resume.
+# Layout: header, then each column (length, face-down count, card ids), foundation suits and ranks per slot (see PackedState), stock, waste, and a bit per displayed waste card for Card.wasteHidden.
+# The header carries Game.stateHash, checked on load so a damaged file is refused instead of dealing a broken game.
+MAGIC = b"SOLG"
+VERSION = 1
+HEADER = struct.Struct("<4sBBBBQIQQ") # magic, version, draw 3, visible waste, cursor, seed, moves, elapsed ms, state hash
+SAVE_NAME = "save.dat"
+
+def defaultPath():
+    return os.path.join(dataDir(), SAVE_NAME)
+
+def serializeGame(game):
+    if len(game.grabbedCards) > 0:
+        raise ValueError("Cards are held; put them back before saving.")
+    state = PackedState.fromGame(game)
+    elapsed = (game.endTime or datetime.datetime.now()) - game.startTime
+    body = bytearray()
+    for i in range(7):
+        body += bytes((len(state.tableau[i]), state.hidden[i])) + state.tableau[i]
+    body += state.foundationSuits + state.foundationRanks
+    body += bytes((len(state.stock),)) + state.stock
+    body += bytes((len(state.waste),)) + state.waste
+    body.append(sum(bit << i for i, bit in enumerate(state.wasteHidden)))
+    header = HEADER.pack(MAGIC, VERSION, state.turnthree, state.visible, state.cursorpos, state.seed, state.moves, int(elapsed.total_seconds() * 1000), game.stateHash())
+    return header + bytes(body)
+
+def deserializeGame(data: bytes):
+    try:
+        magic, version, turnthree, visible, cursorpos, seed, moves, elapsedMs, stateHash = HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"Not a version {VERSION} saved game.")
+        state = PackedState()
+        offset = HEADER.size
+        for i in range(7):
+            length, state.hidden[i] = data[offset], data[offset + 1]
+            state.tableau[i] = bytearray(data[offset + 2:offset + 2 + length])
+            offset += 2 + length
+        state.foundationSuits = bytearray(data[offset:offset + 4])
+        state.foundationRanks = bytearray(data[offset + 4:offset + 8])
+        offset += 8
+        state.stock = bytearray(data[offset + 1:offset + 1 + data[offset]])
+        offset += 1 + data[offset]
+        state.waste = bytearray(data[offset + 1:offset + 1 + data[offset]])
+        offset += 1 + data[offset]
+        bits = data[offset]
+        if offset + 1 != len(data):
+            raise ValueError("Saved game has trailing data.")
+        state.wasteHidden = bytearray(bits >> i & 1 for i in range(visible))
+        state.visible = visible
+        state.turnthree = bool(turnthree)
+        state.seed = seed
+        state.moves = moves
+        state.cursorpos = cursorpos
+        game = state.toGame()
+    except (IndexError, struct.error):
+        raise ValueError("Saved game is truncated or damaged.")
+    if game.stateHash() != stateHash:
+        raise ValueError("Saved game is damaged.")
+    game.startTime = datetime.datetime.now() - datetime.timedelta(milliseconds=elapsedMs)
+    return game
+
+def saveGame(game, path: str = None):
+    path = path or defaultPath()
+    with open(path + ".tmp", "wb") as file:
+        file.write(serializeGame(game))
+    os.replace(path + ".tmp", path)
+
+def loadGame(path: str = None):
+    # The saved game, or None if there isn't one. Raises ValueError for a file that can't be used.
+    try:
+        with open(path or defaultPath(), "rb") as file:
+            data = file.read()
+    except FileNotFoundError:
+        return None
+    return deserializeGame(data)
+
+def removeSave(path: str = None):
+    try:
+        os.remove(path or defaultPath())
+    except FileNotFoundError:
+        pass
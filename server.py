@@ -0,0 +1,248 @@
+import argparse
+import asyncio
+import json
+import os
+import re
+import resource
+import secrets
+import sys
+import time
+from collections import OrderedDict
+from classes import FrameCache, Game, History
+from main import handleKey
+from paths import dataDir
+from render import FrameBuffer
+from savegame import deserializeGame, serializeGame
+
+# ? Many games in one process. Clients connect over a Unix socket or localhost TCP and talk in JSON lines:
+#   client: {"session": null or an id to resume, "draw": 1 or 3, "width": 160, "height": 60}, then {"key": <curses key code>} or {"resize": [width, height]}
+#   server: {"session": id, "frame": n, "ops": [...]} for every message, ops being render.FrameBuffer operations (only what changed since the client's last frame), and {"session": id, "closed": "quit" or "won"} at the end.
+# Sessions idle for a while are written to disk with savegame.py and dropped from memory, connected or not, and loaded back on their next key. Each game keeps a short undo history so a resident session stays small.
+# Usage: python server.py --unix /tmp/solitaire.sock (or --port 8765), then python loadgen.py with the same address.
+SESSION_ID = re.compile(r"^[0-9a-f]{16}$")
+FRAME_CACHE = 4 # Frames cached per session, few so thousands of sessions stay small.
+
+class NoHints:
+    # Hints need a solver process per game, so H does nothing here.
+    def request(self, game):
+        pass
+
+NO_HINTS = NoHints()
+
+class Session:
+    def __init__(self, sessionId: str, game: Game, width: int, height: int):
+        self.id = sessionId
+        self.game = game # None while evicted.
+        self.frameBuffer = FrameBuffer()
+        self.frames = 0
+        self.width = width
+        self.height = height
+        self.connected = False
+        self.lastActive = time.monotonic()
+
+class GameServer:
+    def __init__(self, idleSeconds: float = 300, maxResident: int = 10000, historySize: int = 256):
+        self.idleSeconds = idleSeconds
+        self.maxResident = maxResident
+        self.historySize = historySize
+        self.directory = dataDir("sessions")
+        self.sessions = OrderedDict() # Least recently active first.
+        self.resident = 0
+        self.keys = 0
+        self.evictions = 0
+        self.loads = 0
+
+    def path(self, sessionId: str):
+        return os.path.join(self.directory, sessionId + ".dat")
+
+    def newGame(self, turnthree: bool):
+        game = Game(turnthree)
+        game.history = History(self.historySize)
+        game.frameCache = FrameCache(FRAME_CACHE)
+        game.revealTops()
+        return game
+
+    def open(self, hello):
+        # The session a hello asks for: resident, loaded back from disk, or new.
+        width, height = int(hello.get("width", 160)), int(hello.get("height", 60))
+        sessionId = hello.get("session")
+        if sessionId is not None and not SESSION_ID.match(sessionId):
+            raise ValueError("Bad session id.")
+        if sessionId in self.sessions:
+            session = self.sessions[sessionId]
+            if session.connected:
+                raise ValueError("Session already connected.")
+            session.frameBuffer.invalidate()
+            session.width, session.height = width, height
+        elif sessionId is not None and os.path.exists(self.path(sessionId)):
+            session = Session(sessionId, None, width, height)
+            self.sessions[sessionId] = session
+        else:
+            session = Session(secrets.token_hex(8), self.newGame(hello.get("draw") == 3), width, height)
+            self.sessions[session.id] = session
+            self.resident += 1
+        self.touch(session)
+        return session
+
+    def touch(self, session: Session):
+        session.lastActive = time.monotonic()
+        self.sessions.move_to_end(session.id)
+        if session.game is None:
+            with open(self.path(session.id), "rb") as file:
+                session.game = deserializeGame(file.read())
+            session.game.history = History(self.historySize)
+            session.game.frameCache = FrameCache(FRAME_CACHE)
+            session.frameBuffer.invalidate()
+            self.resident += 1
+            self.loads += 1
+        if self.resident > self.maxResident:
+            self.evictOldest()
+
+    def evict(self, session: Session):
+        session.game.putBackCard()
+        with open(self.path(session.id) + ".tmp", "wb") as file:
+            file.write(serializeGame(session.game))
+        os.replace(self.path(session.id) + ".tmp", self.path(session.id))
+        session.game = None
+        session.frameBuffer = FrameBuffer()
+        self.resident -= 1
+        self.evictions += 1
+        if not session.connected:
+            del self.sessions[session.id]
+
+    def evictOldest(self):
+        for session in list(self.sessions.values()):
+            if self.resident <= self.maxResident:
+                return
+            if session.game is not None:
+                self.evict(session)
+
+    def evictIdle(self):
+        cutoff = time.monotonic() - self.idleSeconds
+        for session in list(self.sessions.values()):
+            if session.lastActive > cutoff:
+                return
+            if session.game is not None:
+                self.evict(session)
+            elif not session.connected:
+                del self.sessions[session.id]
+
+    def close(self, session: Session, reason: str):
+        # Quitting keeps the game on disk to resume later; a won game is finished.
+        if reason == "won":
+            if session.game is not None:
+                self.resident -= 1
+            del self.sessions[session.id]
+            try:
+                os.remove(self.path(session.id))
+            except FileNotFoundError:
+                pass
+        elif session.game is not None:
+            self.evict(session)
+
+    def frame(self, session: Session):
+        operations = session.frameBuffer.update(session.game.drawGame(), session.width, session.height)
+        session.frames += 1
+        return (json.dumps({"session": session.id, "frame": session.frames, "ops": operations}, ensure_ascii=False) + "\n").encode("utf-8")
+
+    async def handle(self, reader, writer):
+        session = None
+        try:
+            hello = json.loads(await reader.readline() or "null")
+            session = self.open(hello or {})
+            session.connected = True
+            writer.write(self.frame(session))
+            await writer.drain()
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                message = json.loads(line)
+                self.touch(session)
+                if "resize" in message:
+                    session.width, session.height = message["resize"]
+                    session.frameBuffer.invalidate()
+                else:
+                    self.keys += 1
+                    game = handleKey(session.game, int(message["key"]), lambda previous: self.newGame(previous.turnthree), NO_HINTS)
+                    if game is None:
+                        self.close(session, "quit")
+                        writer.write((json.dumps({"session": session.id, "closed": "quit"}) + "\n").encode("utf-8"))
+                        break
+                    session.game = game
+                writer.write(self.frame(session))
+                if session.game.winState:
+                    self.close(session, "won")
+                    writer.write((json.dumps({"session": session.id, "closed": "won"}) + "\n").encode("utf-8"))
+                    break
+                await writer.drain()
+        except (ValueError, KeyError, TypeError, OSError) as error:
+            try:
+                writer.write((json.dumps({"error": str(error)}) + "\n").encode("utf-8"))
+            except OSError:
+                pass
+        finally:
+            if session is not None:
+                session.connected = False
+            try:
+                await writer.drain()
+                writer.close()
+                await writer.wait_closed()
+            except OSError:
+                pass
+
+    async def housekeeping(self, statsInterval: float):
+        start = time.monotonic()
+        lastStats = start
+        lastKeys = 0
+        while True:
+            await asyncio.sleep(1)
+            self.evictIdle()
+            now = time.monotonic()
+            if statsInterval > 0 and now - lastStats >= statsInterval:
+                usage = resource.getrusage(resource.RUSAGE_SELF)
+                connected = sum(session.connected for session in self.sessions.values())
+                print(f"{connected} connected, {self.resident} resident, {self.evictions} evicted, {self.loads} loaded. {(self.keys - lastKeys) / (now - lastStats):.0f} keys/s, CPU {usage.ru_utime + usage.ru_stime:.1f}s, peak memory {usage.ru_maxrss} KiB.", file=sys.stderr)
+                lastStats = now
+                lastKeys = self.keys
+
+def raiseFileLimit():
+    # A connection is a file descriptor; thousands of them need more than the usual soft limit of 1024.
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if hard == resource.RLIM_INFINITY or soft < hard:
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard if hard != resource.RLIM_INFINITY else 65536, hard))
+        except (ValueError, OSError):
+            pass
+
+async def serve(args):
+    server = GameServer(args.idle, args.max_resident, args.history)
+    if args.unix:
+        if os.path.exists(args.unix):
+            os.remove(args.unix)
+        listener = await asyncio.start_unix_server(server.handle, args.unix, limit=4096, backlog=4096)
+    else:
+        listener = await asyncio.start_server(server.handle, "127.0.0.1", args.port, limit=4096, backlog=4096)
+    print(f"Serving on {args.unix or f'127.0.0.1:{args.port}'}.", file=sys.stderr)
+    asyncio.get_running_loop().create_task(server.housekeeping(args.stats))
+    async with listener:
+        await listener.serve_forever()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Host many solitaire games in one process over a local socket.")
+    parser.add_argument("--unix", default=None, help="Unix socket path to listen on.")
+    parser.add_argument("--port", type=int, default=8765, help="Localhost TCP port, when not using --unix.")
+    parser.add_argument("--idle", type=float, default=300, help="Seconds without a key before a session is written to disk and dropped from memory.")
+    parser.add_argument("--max-resident", type=int, default=10000, help="Most sessions kept in memory; the least recently active go to disk first.")
+    parser.add_argument("--history", type=int, default=256, help="Undo steps kept per session.")
+    parser.add_argument("--stats", type=float, default=10, help="Seconds between stats lines on stderr, 0 for none.")
+    args = parser.parse_args(argv)
+    raiseFileLimit()
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+
+# Init.
+if __name__ == "__main__":
+    main()
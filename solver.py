@@ -0,0 +1,325 @@
+from collections import OrderedDict
+import time
+from classes import RANK, RED, SUIT, Pile, Move
+from packed import PackedState
+
+try:
+    import resource
+except ImportError: # Not available on Windows.
+    resource = None
+
+CARD_BYTES = tuple(bytes((card,)) for card in range(52))
+
+# ? A search state is a plain tuple of bytes so it can be hashed and sliced cheaply:
+# (tableau, hidden, foundation, stock, waste, visible)
+# tableau    - 7 bytes of card ids (see packed.py), bottom to top.
+# hidden     - number of face-down cards at the bottom of each column.
+# foundation - highest rank on the foundation of each suit index.
+# stock      - Deck.cards order, next card to draw is last.
+# waste      - Deck.removed_cards order.
+# visible    - how many cards at the end of the waste are still on display (len(Game.waste)).
+def stateFromPacked(packed: PackedState):
+    tableau = [bytes(column) for column in packed.tableau]
+    foundation = packed.foundationBySuit()
+    waste = bytes(packed.waste)
+    visible = packed.visible
+    # An in-progress grab is treated as if it was put back.
+    if len(packed.grabbed) > 0 and packed.grabbedPos:
+        if packed.grabbedPos <= 7:
+            tableau[packed.grabbedPos - 1] += bytes(packed.grabbed)
+        elif packed.grabbedPos == 8:
+            waste += bytes(packed.grabbed)
+            visible += 1
+        else:
+            card = packed.grabbed[0]
+            foundation[SUIT[card]] = max(foundation[SUIT[card]], RANK[card])
+    hidden = tuple(min(packed.hidden[i], max(len(tableau[i]) - 1, 0)) for i in range(7))
+    return (tuple(tableau), hidden, tuple(foundation), bytes(packed.stock), waste, visible)
+
+def stateFromGame(game):
+    return stateFromPacked(PackedState.fromGame(game))
+
+def stateKey(state):
+    # Columns are interchangeable, so sort them to fold mirrored positions into a single entry.
+    tableau, hidden, foundation, stock, waste, visible = state
+    return hash((tuple(sorted(zip(tableau, hidden))), foundation, stock, waste, visible))
+
+def isWon(state):
+    return sum(state[2]) == 52
+
+def isTriviallyWon(state):
+    # All cards face up with nothing left in the stock and waste can always be played straight to the foundations.
+    return len(state[3]) == 0 and len(state[4]) == 0 and sum(state[1]) == 0
+
+def isSafeToFoundation(card, foundation):
+    rank = RANK[card]
+    if rank <= 2:
+        return True
+    if RED[card]:
+        return foundation[0] >= rank - 1 and foundation[2] >= rank - 1
+    return foundation[1] >= rank - 1 and foundation[3] >= rank - 1
+
+def _replace(items, index, value):
+    return items[:index] + (value,) + items[index + 1:]
+
+def _revealed(column, hidden):
+    return min(hidden, max(len(column) - 1, 0))
+
+def kingWaiting(tableau, hidden, stock, waste):
+    # A King that could go to an empty column: face up but not already at the bottom of one, or anywhere in the stock and waste.
+    for i in range(7):
+        for k in range(max(hidden[i], 1), len(tableau[i])):
+            if RANK[tableau[i][k]] == 13:
+                return True
+    return any(RANK[card] == 13 for card in stock) or any(RANK[card] == 13 for card in waste)
+
+def takerWaiting(card, tableau, hidden, waste, visible):
+    # A card that could go on card once it's back on the tableau: the waste top, or any face-up tableau card.
+    rank, red = RANK[card] - 1, RED[card]
+    if visible and RANK[waste[-1]] == rank and RED[waste[-1]] != red:
+        return True
+    for i in range(7):
+        for k in range(hidden[i], len(tableau[i])):
+            if RANK[tableau[i][k]] == rank and RED[tableau[i][k]] != red:
+                return True
+    return False
+
+# Moves that make no progress are left out: a tableau run only moves to turn over a face-down card, to empty a column a King is waiting for,
+# or to uncover a card that goes straight to its foundation, and a card only comes back down from a foundation when something is waiting to go on it.
+def successors(state, drawCount):
+    tableau, hidden, foundation, stock, waste, visible = state
+    foundationMoves = []
+    tableauMoves = []
+    otherMoves = []
+
+    # Anything to the foundation.
+    if visible:
+        card = waste[-1]
+        suit = SUIT[card]
+        if foundation[suit] == RANK[card] - 1:
+            move = (Move(Pile.Waste, 0, Pile.Foundation, suit, 1), (tableau, hidden, _replace(foundation, suit, RANK[card]), stock, waste[:-1], visible - 1))
+            if isSafeToFoundation(card, foundation):
+                return [move]
+            foundationMoves.append(move)
+    for i in range(7):
+        column = tableau[i]
+        if len(column) == 0:
+            continue
+        card = column[-1]
+        suit = SUIT[card]
+        if foundation[suit] == RANK[card] - 1:
+            newColumn = column[:-1]
+            move = (Move(Pile.Tableau, i, Pile.Foundation, suit, 1), (_replace(tableau, i, newColumn), _replace(hidden, i, _revealed(newColumn, hidden[i])), _replace(foundation, suit, RANK[card]), stock, waste, visible))
+            if isSafeToFoundation(card, foundation):
+                return [move]
+            foundationMoves.append(move)
+
+    firstEmpty = -1
+    for i in range(7):
+        if len(tableau[i]) == 0:
+            firstEmpty = i
+            break
+
+    # Tableau to tableau. Moves that turn over a card or clear a column are tried first.
+    kingFree = None
+    for i in range(7):
+        column = tableau[i]
+        for start in range(hidden[i], len(column)):
+            if start > hidden[i]:
+                under = column[start - 1]
+                if foundation[SUIT[under]] != RANK[under] - 1:
+                    continue
+            elif start == 0:
+                if kingFree is None:
+                    kingFree = kingWaiting(tableau, hidden, stock, waste)
+                if not kingFree:
+                    continue
+            base = column[start]
+            for j in range(7):
+                if j == i:
+                    continue
+                target = tableau[j]
+                if len(target) == 0:
+                    if RANK[base] != 13 or start == 0 or j != firstEmpty:
+                        continue
+                elif RANK[target[-1]] != RANK[base] + 1 or RED[target[-1]] == RED[base]:
+                    continue
+                newColumn = column[:start]
+                newTableau = _replace(_replace(tableau, i, newColumn), j, target + column[start:])
+                newHidden = _replace(hidden, i, _revealed(newColumn, hidden[i]))
+                move = (Move(Pile.Tableau, i, Pile.Tableau, j, len(column) - start), (newTableau, newHidden, foundation, stock, waste, visible))
+                if start == hidden[i]:
+                    tableauMoves.append(move)
+                else:
+                    otherMoves.append(move)
+
+    # Waste to tableau.
+    if visible:
+        card = waste[-1]
+        for j in range(7):
+            target = tableau[j]
+            if len(target) == 0:
+                if RANK[card] != 13 or j != firstEmpty:
+                    continue
+            elif RANK[target[-1]] != RANK[card] + 1 or RED[target[-1]] == RED[card]:
+                continue
+            tableauMoves.append((Move(Pile.Waste, 0, Pile.Tableau, j, 1), (_replace(tableau, j, target + CARD_BYTES[card]), hidden, foundation, stock, waste[:-1], visible - 1)))
+
+    # Foundation back down to the tableau.
+    for suit in range(4):
+        if foundation[suit] == 0:
+            continue
+        card = suit * 13 + foundation[suit] - 1
+        if not takerWaiting(card, tableau, hidden, waste, visible):
+            continue
+        for j in range(7):
+            target = tableau[j]
+            if len(target) == 0:
+                if RANK[card] != 13 or j != firstEmpty:
+                    continue
+            elif RANK[target[-1]] != RANK[card] + 1 or RED[target[-1]] == RED[card]:
+                continue
+            otherMoves.append((Move(Pile.Foundation, suit, Pile.Tableau, j, 1), (_replace(tableau, j, target + CARD_BYTES[card]), hidden, _replace(foundation, suit, foundation[suit] - 1), stock, waste, visible)))
+
+    # Drawing, and resetting the waste (same as Game.drawNewWaste and Game.resetWaste).
+    if len(stock) > 0:
+        count = min(drawCount, len(stock))
+        otherMoves.append((Move(Pile.Stock, 0, Pile.Waste, 0, count), (tableau, hidden, foundation, stock[:-count], waste + stock[:-count - 1:-1], count)))
+    if len(waste) > 0:
+        otherMoves.append((Move(Pile.Waste, 0, Pile.Stock, 0, len(waste)), (tableau, hidden, foundation, stock + waste[::-1], b"", 0)))
+
+    return foundationMoves + tableauMoves + otherMoves
+
+def shortenPath(states, moves, drawCount):
+    # states[i] is the exact position before moves[i] (states has one more). Wherever a position has a move straight to a later one on the path, take it and drop the detour.
+    # Exact positions, not stateKey, since the moves after the shortcut name real columns.
+    position = {state: i for i, state in enumerate(states)}
+    output = []
+    i = 0
+    while i < len(moves):
+        furthest, move = i + 1, moves[i]
+        for candidate, child in successors(states[i], drawCount):
+            if position.get(child, 0) > furthest:
+                furthest, move = position[child], candidate
+        output.append(move)
+        i = furthest
+    return output
+
+def finishTrivialWin(state):
+    # Plays out a trivially won state (see isTriviallyWon), lowest card first.
+    tableau, hidden, foundation, stock, waste, visible = state
+    tableau = [list(column) for column in tableau]
+    foundation = list(foundation)
+    moves = []
+    while sum(foundation) < 52:
+        for i in range(7):
+            if len(tableau[i]) > 0 and foundation[SUIT[tableau[i][-1]]] == RANK[tableau[i][-1]] - 1:
+                card = tableau[i].pop()
+                foundation[SUIT[card]] += 1
+                moves.append(Move(Pile.Tableau, i, Pile.Foundation, SUIT[card], 1))
+    return moves
+
+def assignFoundationSlots(game, moves):
+    # The solver tracks foundations by suit, Game tracks them by slot. Map one to the other by following the moves.
+    suits = [pile.cards[-1].suit.value - 1 if len(pile.cards) > 0 else None for pile in game.foundation]
+    counts = [len(pile.cards) for pile in game.foundation]
+    output = []
+    for move in moves:
+        if move.destination == Pile.Foundation:
+            suit = move.destinationIndex
+            if suit in suits and counts[suits.index(suit)] > 0:
+                slot = suits.index(suit)
+            else:
+                slot = counts.index(0)
+            suits[slot] = suit
+            counts[slot] += 1
+            move = move._replace(destinationIndex=slot)
+        elif move.source == Pile.Foundation:
+            slot = suits.index(move.sourceIndex)
+            counts[slot] -= 1
+            if counts[slot] == 0:
+                suits[slot] = None
+            move = move._replace(sourceIndex=slot)
+        output.append(move)
+    return output
+
+def peakMemory():
+    # Peak resident set size in KiB, or None where it can't be read.
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+class SolveResult:
+    def __init__(self, solvable, moves, nodes, elapsed, tablePeak):
+        self.solvable = solvable # True, False, or None if the search ran out of nodes. False only covers the moves successors tries, so it's not a proof.
+        self.moves = moves
+        self.nodes = nodes
+        self.elapsed = elapsed
+        self.tablePeak = tablePeak
+        self.peakMemory = peakMemory()
+
+    @property
+    def nodesPerSecond(self):
+        return self.nodes / self.elapsed if self.elapsed > 0 else 0.0
+
+    def __str__(self):
+        outcome = {True: "Winnable", False: "Unwinnable", None: "Unknown"}[self.solvable]
+        return f"{outcome} in {len(self.moves)} moves. {self.nodes} nodes, {self.nodesPerSecond:.0f} nodes/s, table peak {self.tablePeak}, peak memory {self.peakMemory} KiB."
+
+class Solver:
+    def __init__(self, game, maxNodes: int = 500000, tableSize: int = 1 << 20, cancelled = None):
+        self.game = game
+        self.cancelled = cancelled # Optional callable, polled every few thousand nodes; returning True gives up like running out of nodes.
+        self.drawCount = 3 if game.turnthree else 1
+        self.maxNodes = maxNodes
+        self.tableSize = tableSize
+        # ? Transposition table of state hashes that are already fully explored (or on the current path). Oldest entries are evicted first; losing one only costs a re-search, never a wrong answer.
+        self.table = OrderedDict()
+
+    def remember(self, key):
+        self.table[key] = None
+        if len(self.table) > self.tableSize:
+            self.table.popitem(last=False)
+
+    def solve(self):
+        startTime = time.perf_counter()
+        start = stateFromGame(self.game)
+        nodes = 1
+        tablePeak = 0
+        self.table.clear()
+
+        if isWon(start) or isTriviallyWon(start):
+            return SolveResult(True, assignFoundationSlots(self.game, finishTrivialWin(start)), nodes, time.perf_counter() - startTime, 0)
+
+        onPath = {stateKey(start)}
+        path = []
+        stack = [(start, iter(successors(start, self.drawCount)))]
+        while stack:
+            if nodes >= self.maxNodes or (self.cancelled is not None and nodes % 4096 == 0 and self.cancelled()):
+                return SolveResult(None, [], nodes, time.perf_counter() - startTime, tablePeak)
+            state, children = stack[-1]
+            for move, child in children:
+                key = stateKey(child)
+                if key in onPath or key in self.table:
+                    continue
+                nodes += 1
+                if isWon(child) or isTriviallyWon(child):
+                    moves = shortenPath([entry[0] for entry in stack] + [child], path + [move], self.drawCount) + finishTrivialWin(child)
+                    return SolveResult(True, assignFoundationSlots(self.game, moves), nodes, time.perf_counter() - startTime, tablePeak)
+                onPath.add(key)
+                path.append(move)
+                stack.append((child, iter(successors(child, self.drawCount))))
+                break
+            else:
+                # Every child is either explored or on the path; this state can't lead anywhere new.
+                stack.pop()
+                key = stateKey(state)
+                onPath.discard(key)
+                self.remember(key)
+                tablePeak = max(tablePeak, len(self.table))
+                if len(path) > 0:
+                    path.pop()
+        return SolveResult(False, [], nodes, time.perf_counter() - startTime, tablePeak)
+
+def solveGame(game, maxNodes: int = 500000, tableSize: int = 1 << 20):
+    return Solver(game, maxNodes, tableSize).solve()
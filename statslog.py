@@ -0,0 +1,192 @@
+import argparse
+import datetime
+import os
+import queue
+import struct
+import threading
+import time
+from paths import dataDir
+
+# ? Finished and abandoned games, one fixed-size record each appended to stats.log in the data directory:
+# finish time, deal seed, draw mode, outcome, moves and duration. A truncated last record (crash mid-write) is ignored.
+# stats.idx keeps per mode totals, streaks and the best times, plus how much of the log they cover. Reading the stats only folds in records added since, and a missing or damaged index is rebuilt from the log.
+# Records are handed to a writer thread, which appends everything queued in one write and one fsync, so finishing a game never waits on the disk.
+MAGIC = b"SOLS"
+VERSION = 1
+HEADER = struct.Struct("<4sB")
+RECORD = struct.Struct("<dQBBII") # finish time, seed, draw 1 or 3, outcome, moves, duration ms
+INDEX_HEADER = struct.Struct("<4sBQ") # magic, version, log bytes covered
+MODE = struct.Struct("<IIiIIB") # games, wins, current streak, longest streak, longest losing streak, best time count
+BEST = struct.Struct("<IIQ") # duration ms, moves, seed
+BEST_TIMES = 10
+LOG_NAME = "stats.log"
+INDEX_NAME = "stats.idx"
+
+ABANDONED = 0
+WON = 1
+
+class ModeStats:
+    def __init__(self):
+        self.games = 0
+        self.wins = 0
+        self.streak = 0 # Positive for wins in a row, negative for losses.
+        self.longestStreak = 0
+        self.longestLosingStreak = 0
+        self.bestTimes = [] # (duration ms, moves, seed), fastest first.
+
+    def add(self, seed: int, outcome: int, moves: int, durationMs: int):
+        self.games += 1
+        if outcome == WON:
+            self.wins += 1
+            self.streak = max(self.streak, 0) + 1
+            self.longestStreak = max(self.longestStreak, self.streak)
+            self.bestTimes.append((durationMs, moves, seed))
+            self.bestTimes.sort()
+            del self.bestTimes[BEST_TIMES:]
+        else:
+            self.streak = min(self.streak, 0) - 1
+            self.longestLosingStreak = max(self.longestLosingStreak, -self.streak)
+
+    @property
+    def winRate(self):
+        return self.wins / self.games if self.games > 0 else 0
+
+class StatsIndex:
+    def __init__(self, directory: str = None):
+        self.logPath = os.path.join(directory or dataDir(), LOG_NAME)
+        self.indexPath = os.path.join(directory or dataDir(), INDEX_NAME)
+        self.modes = {1: ModeStats(), 3: ModeStats()}
+        self.covered = HEADER.size
+        try:
+            self.read()
+        except (OSError, ValueError, struct.error):
+            self.modes = {1: ModeStats(), 3: ModeStats()}
+            self.covered = HEADER.size
+        self.update()
+
+    def read(self):
+        with open(self.indexPath, "rb") as file:
+            data = file.read()
+        magic, version, self.covered = INDEX_HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("Not a stats index.")
+        offset = INDEX_HEADER.size
+        for draw in (1, 3):
+            mode = self.modes[draw]
+            mode.games, mode.wins, mode.streak, mode.longestStreak, mode.longestLosingStreak, count = MODE.unpack_from(data, offset)
+            offset += MODE.size
+            mode.bestTimes = [BEST.unpack_from(data, offset + i * BEST.size) for i in range(count)]
+            offset += count * BEST.size
+        if offset != len(data):
+            raise ValueError("Stats index has trailing data.")
+
+    def write(self):
+        output = bytearray(INDEX_HEADER.pack(MAGIC, VERSION, self.covered))
+        for draw in (1, 3):
+            mode = self.modes[draw]
+            output += MODE.pack(mode.games, mode.wins, mode.streak, mode.longestStreak, mode.longestLosingStreak, len(mode.bestTimes))
+            for best in mode.bestTimes:
+                output += BEST.pack(*best)
+        with open(self.indexPath + ".tmp", "wb") as file:
+            file.write(output)
+        os.replace(self.indexPath + ".tmp", self.indexPath)
+
+    def update(self):
+        # Folds in records appended since the index was written. Returns how many there were.
+        try:
+            with open(self.logPath, "rb") as file:
+                size = file.seek(0, os.SEEK_END)
+                if size < self.covered:
+                    # The log was replaced or cut short; start over.
+                    self.modes = {1: ModeStats(), 3: ModeStats()}
+                    self.covered = HEADER.size
+                if size - self.covered < RECORD.size:
+                    return 0
+                file.seek(self.covered)
+                data = file.read((size - self.covered) // RECORD.size * RECORD.size)
+        except FileNotFoundError:
+            return 0
+        count = 0
+        for finished, seed, draw, outcome, moves, durationMs in RECORD.iter_unpack(data):
+            if draw in self.modes:
+                self.modes[draw].add(seed, outcome, moves, durationMs)
+            count += 1
+        self.covered += len(data)
+        try:
+            self.write()
+        except OSError:
+            pass
+        return count
+
+def statsWriter(path: str, records):
+    while True:
+        batch = [records.get()]
+        while True:
+            try:
+                batch.append(records.get_nowait())
+            except queue.Empty:
+                break
+        stop = None in batch
+        data = b"".join(record for record in batch if record is not None)
+        if len(data) > 0:
+            try:
+                with open(path, "ab") as file:
+                    if file.tell() == 0:
+                        file.write(HEADER.pack(MAGIC, VERSION))
+                    elif (file.tell() - HEADER.size) % RECORD.size != 0:
+                        # Drop a partial record left by a crash, so the records after it line up.
+                        file.truncate(HEADER.size + (file.tell() - HEADER.size) // RECORD.size * RECORD.size)
+                    file.write(data)
+                    file.flush()
+                    os.fsync(file.fileno())
+            except OSError: # Stats are optional, never stop the game over them.
+                pass
+        if stop:
+            return
+
+class StatsLog:
+    def __init__(self, directory: str = None):
+        self.path = os.path.join(directory or dataDir(), LOG_NAME)
+        self.records = queue.Queue()
+        self.thread = None
+
+    def record(self, game, outcome: int):
+        if self.thread is None:
+            # Started on the first record, like the hint process.
+            self.thread = threading.Thread(target=statsWriter, args=(self.path, self.records), daemon=True)
+            self.thread.start()
+        duration = (game.endTime or datetime.datetime.now()) - game.startTime
+        self.records.put(RECORD.pack(time.time(), game.seed, 3 if game.turnthree else 1, outcome, game.moves, int(duration.total_seconds() * 1000)))
+
+    def close(self):
+        if self.thread is not None:
+            self.records.put(None)
+            self.thread.join()
+            self.thread = None
+
+def formatDuration(ms: int):
+    return f"{ms // 60000}:{ms // 1000 % 60:02}"
+
+def summaryText(index: StatsIndex):
+    lines = []
+    for draw, mode in index.modes.items():
+        streak = f"{mode.streak} win{'s' if mode.streak != 1 else ''}" if mode.streak >= 0 else f"{-mode.streak} loss{'es' if mode.streak != -1 else ''}"
+        lines.append(f"Draw {draw}: {mode.games} games, {mode.wins} won ({mode.winRate:.0%}). Streak {streak}, longest {mode.longestStreak}.")
+        if len(mode.bestTimes) > 0:
+            lines.append("    Best times (mm:ss): " + ", ".join(f"{formatDuration(durationMs)} ({moves} moves)" for durationMs, moves, seed in mode.bestTimes[:5]))
+    return "\n".join(lines)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Show win rate, streaks and best times from the stats log.")
+    parser.add_argument("--rebuild", action="store_true", help="Rebuild the index from the whole log first.")
+    args = parser.parse_args(argv)
+    if args.rebuild:
+        try:
+            os.remove(os.path.join(dataDir(), INDEX_NAME))
+        except FileNotFoundError:
+            pass
+    print(summaryText(StatsIndex()))
+
+# Init.
+if __name__ == "__main__":
+    main()
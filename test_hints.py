@@ -0,0 +1,46 @@
+import time
+import unittest
+from hints import HintWorker
+from packed import PackedState
+
+# ? Hints on a won game: nothing to search for, and a solver answer without a move must not be described as one.
+# Usage: python -m unittest test_hints
+
+def wonGame():
+    state = PackedState()
+    state.foundationSuits = bytearray(range(4))
+    state.foundationRanks = bytearray([13] * 4)
+    game = state.toGame()
+    game.checkWin()
+    return game
+
+class WonGameHints(unittest.TestCase):
+    def setUp(self):
+        self.hints = HintWorker()
+
+    def tearDown(self):
+        self.hints.close()
+
+    def testRequestOnWonGame(self):
+        game = wonGame()
+        self.assertTrue(game.winState)
+        self.hints.request(game)
+        self.assertIsNone(self.hints.process)
+        self.assertFalse(self.hints.waiting)
+        self.assertFalse(self.hints.update(game))
+
+    def testSolverAnswerWithoutMove(self):
+        # The worker answers a won position with solvable and no first move.
+        game = wonGame()
+        game.winState = False
+        self.hints.request(game)
+        deadline = time.monotonic() + 10
+        while self.hints.waiting and time.monotonic() < deadline:
+            self.hints.update(game)
+            time.sleep(0.01)
+        self.assertFalse(self.hints.waiting)
+        self.assertEqual(game.statusMessage, "Hint: nothing left to move. Winnable from here: yes.")
+
+# Init.
+if __name__ == "__main__":
+    unittest.main()